@@ -0,0 +1,271 @@
+# Import the bultin libraries.
+import logging
+import sys
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+
+# Import the local/project packages, modules, and fucntions.
+from utils.data_collection import (
+    OPTIMIZED_STATS_COLUMNS,
+    STATS_URL,
+    split_stats_page
+)
+from utils.data_pipeline import produce_pages, row_bytes
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The numpy types of the optimized stats columns.
+NUMPY_TYPES = {"int2": np.int16, "int4": np.int32, "float4": np.float32}
+
+# The value of the missing integers (the counts and the seconds are
+# never negative).
+MISSING = -1
+
+# The columns converted to categoricals by BoxScores.to_frame.
+CATEGORY_COLUMNS = ("season", "team_id")
+
+# The columns that are always set (they are not nullable in to_frame).
+KEY_COLUMNS = ("id", "season", "game_id", "team_id", "player_id")
+
+
+def parse_minutes_series(minutes):
+    """Converts the minutes like "34:12" or "34" to seconds.
+
+    This is the vectorized data_collection.parse_minutes; the empty and
+    malformed values are MISSING.
+    """
+    parts = minutes.astype("string").str.partition(":")
+    whole = pd.to_numeric(parts[0], errors="coerce")
+    seconds = pd.to_numeric(parts[2].replace("", "0"), errors="coerce")
+    total = (whole * 60).round() + seconds
+    return total.fillna(MISSING).to_numpy(dtype=np.int32)
+
+
+class BoxScores:
+    """Stores the stats rows as one numpy array per column.
+
+    The columns and types are the ones of the optimized stats table
+    (see data_collection.OPTIMIZED_STATS_COLUMNS): the counts are
+    int16, the percentages float32 and the minutes are parsed to
+    min_seconds (int32, like its int4 column). The missing integers
+    are stored as MISSING and the missing floats as NaN. A million rows
+    take about 60 MB instead of about 230 MB as a default DataFrame and
+    1.4 GB as dicts (see measure_memory).
+    """
+
+    columns = [column for column, _ in OPTIMIZED_STATS_COLUMNS]
+    dtypes = {
+        column: NUMPY_TYPES[pg_type]
+        for column, pg_type in OPTIMIZED_STATS_COLUMNS
+    }
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __len__(self):
+        return len(self.arrays["id"])
+
+    def __getitem__(self, index):
+        """Selects the rows by a slice, indices or a boolean mask."""
+        return BoxScores(
+            {column: array[index] for column, array in self.arrays.items()}
+        )
+
+    @property
+    def nbytes(self):
+        """Gets memory of the arrays in bytes."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    @classmethod
+    def empty(cls):
+        """Creates an object without rows."""
+        return cls({
+            column: np.empty(0, dtype=dtype)
+            for column, dtype in cls.dtypes.items()
+        })
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Creates an object from the stats rows of split_stats_page."""
+        arrays = {}
+        for column, dtype in cls.dtypes.items():
+            values = (row[column] for row in rows)
+            if np.issubdtype(dtype, np.floating):
+                # None is converted to NaN.
+                arrays[column] = np.fromiter(
+                    (np.nan if value is None else value for value in values),
+                    dtype=dtype,
+                    count=len(rows)
+                )
+            else:
+                arrays[column] = np.fromiter(
+                    (MISSING if value is None else value for value in values),
+                    dtype=dtype,
+                    count=len(rows)
+                )
+        return cls(arrays)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Creates an object from a DataFrame of the stats table.
+
+        The DataFrame has the min_seconds column or the min column as
+        text, and the season column (join the games table for it).
+        """
+        arrays = {}
+        for column, dtype in cls.dtypes.items():
+            if column == "min_seconds" and column not in df.columns:
+                arrays[column] = parse_minutes_series(df["min"])
+            elif np.issubdtype(dtype, np.floating):
+                arrays[column] = df[column].to_numpy(dtype=dtype)
+            else:
+                arrays[column] = (
+                    pd.to_numeric(df[column]).fillna(MISSING)
+                    .to_numpy(dtype=dtype)
+                )
+        return cls(arrays)
+
+    @classmethod
+    def concat(cls, parts):
+        """Concatenates the objects."""
+        parts = list(parts)
+        if not parts:
+            return cls.empty()
+        return cls({
+            column: np.concatenate([part.arrays[column] for part in parts])
+            for column in cls.columns
+        })
+
+    def to_frame(self, categorical=True):
+        """Converts the rows to a DataFrame without copying the arrays.
+
+        The integer columns with missing values are nullable (Int16),
+        and the season and team_id columns are categoricals if
+        categorical is True.
+        """
+        data = {}
+        for column, array in self.arrays.items():
+            if column in KEY_COLUMNS or array.dtype.kind == "f":
+                data[column] = array
+            else:
+                data[column] = pd.arrays.IntegerArray(
+                    array, array == MISSING
+                )
+            if categorical and column in CATEGORY_COLUMNS:
+                data[column] = pd.Categorical(array)
+        return pd.DataFrame(data, copy=False)
+
+    def to_rows(self):
+        """Yields the rows as dicts with None for missing values.
+
+        The rows can be inserted with
+        data_collection.insert_data(..., optimized=True).
+        """
+        lists = {
+            column: array.tolist() for column, array in self.arrays.items()
+        }
+        for values in zip(*lists.values()):
+            row = dict(zip(lists, values))
+            for column, value in row.items():
+                if value == MISSING and column not in KEY_COLUMNS:
+                    row[column] = None
+                elif value != value:
+                    row[column] = None
+            yield row
+
+
+def fetch_box_scores(seasons, url=STATS_URL, limiter=None, session=None):
+    """Gets the stats rows of the seasons over API as BoxScores.
+
+    Every page is converted to arrays right away, so the dicts of only
+    one page are kept in memory.
+    """
+    parts = []
+    for season in seasons:
+        for _, _, data in produce_pages(
+            season, url=url, limiter=limiter, session=session
+        ):
+            _, _, rows = split_stats_page(data)
+            parts.append(BoxScores.from_rows(rows))
+    box_scores = BoxScores.concat(parts)
+    logger.info(
+        f"{len(box_scores)} box scores have been retrieved "
+        f"({box_scores.nbytes / 1024 ** 2:.1f} MB)."
+    )
+    return box_scores
+
+
+def synthetic_box_scores(num_rows=1000000, seed=42):
+    """Creates random box scores for the memory measurements."""
+    rng = np.random.default_rng(seed)
+    arrays = {}
+    for column, dtype in BoxScores.dtypes.items():
+        if np.issubdtype(dtype, np.floating):
+            values = rng.random(num_rows).astype(dtype)
+            values[rng.random(num_rows) < 0.1] = np.nan
+        elif column in KEY_COLUMNS:
+            values = rng.integers(1, 30000, num_rows).astype(dtype)
+        else:
+            values = rng.integers(0, 40, num_rows).astype(dtype)
+            values[rng.random(num_rows) < 0.05] = MISSING
+        arrays[column] = values
+    arrays["id"] = np.arange(num_rows, dtype=np.int32)
+    arrays["season"] = rng.integers(1983, 2024, num_rows).astype(np.int16)
+    arrays["min_seconds"] = rng.integers(0, 3000, num_rows).astype(np.int32)
+    return BoxScores(arrays)
+
+
+def measure_memory(num_rows=1000000, seed=42, sample_rows=10000):
+    """Measures memory per million box scores in every representation.
+
+    The representations are:
+        - dicts: the rows of split_stats_page (estimated on
+          sample_rows rows by data_pipeline.row_bytes),
+        - default DataFrame: int64/float64 columns and min as text,
+        - BoxScores: the numpy arrays,
+        - BoxScores.to_frame(): the compact DataFrame.
+    Returns a DataFrame with MB per million rows.
+    """
+    box_scores = synthetic_box_scores(num_rows, seed)
+    sample = list(box_scores[:sample_rows].to_rows())
+    for row in sample:
+        seconds = row["min_seconds"]
+        row["min"] = f"{seconds // 60}:{seconds % 60:02d}"
+    dict_bytes = sum(row_bytes(row) for row in sample) / len(sample)
+    df = box_scores.to_frame(categorical=False)
+    default = df.drop(columns="min_seconds").astype({
+        column: "int64" if column in KEY_COLUMNS else "float64"
+        for column in df.columns if column != "min_seconds"
+    })
+    seconds = box_scores.arrays["min_seconds"]
+    default["min"] = pd.Series(seconds // 60).astype(str).str.cat(
+        pd.Series(seconds % 60).astype(str).str.zfill(2), sep=":"
+    ).astype(object)
+    scale = 1000000 / num_rows / 1024 ** 2
+    results = pd.DataFrame({
+        "representation": [
+            "dicts", "default DataFrame", "BoxScores",
+            "BoxScores.to_frame()"
+        ],
+        "mb_per_million": [
+            dict_bytes * 1000000 / 1024 ** 2,
+            default.memory_usage(deep=True).sum() * scale,
+            box_scores.nbytes * scale,
+            box_scores.to_frame().memory_usage(deep=True).sum() * scale
+        ]
+    })
+    logger.info(f"Memory per million box scores:\n{results}")
+    return results
@@ -0,0 +1,155 @@
+# Import the bultin libraries.
+import logging
+import sys
+import weakref
+
+# Import the local/project packages, modules, and fucntions.
+from utils.db_io import is_sqlite
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The catalogs by connection. The entry is removed when the connection
+# is garbage collected.
+catalog_cache = weakref.WeakKeyDictionary()
+# sqlite3.Connection cannot be weakly referenced, so its catalog is kept
+# by the connection id together with the connection (the id cannot be
+# reused while the connection is alive).
+sqlite_catalog_cache = {}
+
+
+def catalog_entry(conn):
+    """Gets the cached catalog dict of the connection."""
+    try:
+        return catalog_cache.setdefault(conn, {})
+    except TypeError:
+        return sqlite_catalog_cache.setdefault(id(conn), {"conn": conn})
+
+
+def get_catalog(conn, exact=False, refresh=False):
+    """Gets the columns and row counts of all tables.
+
+    Returns a tuple of 2 dicts with the table name as the key:
+        - the list of column rows: (cid, name, type, notnull,
+          dflt_value, pk) for SQLite (like PRAGMA table_info) and
+          (ordinal_position, column_name, data_type, is_nullable,
+          column_default) for PostgreSQL (like
+          information_schema.columns),
+        - the number of rows, approximate unless exact is True (see
+          get_row_counts).
+    The result is cached for the connection; set refresh to reload it
+    (or see clear_catalog).
+    """
+    if refresh:
+        clear_catalog(conn)
+    cache = catalog_entry(conn)
+    if "columns" not in cache:
+        cache["columns"] = get_columns(conn)
+    key = "exact_counts" if exact else "counts"
+    if key not in cache:
+        cache[key] = get_row_counts(conn, list(cache["columns"]), exact)
+    return cache["columns"], cache[key]
+
+
+def clear_catalog(conn=None):
+    """Removes the cached catalog of the connection (or all catalogs)."""
+    if conn is None:
+        catalog_cache.clear()
+        sqlite_catalog_cache.clear()
+        return
+    try:
+        catalog_cache.pop(conn, None)
+    except TypeError:
+        sqlite_catalog_cache.pop(id(conn), None)
+
+
+def get_columns(conn):
+    """Gets the columns of all tables in one query."""
+    cur = conn.cursor()
+    if is_sqlite(conn):
+        cur.execute("""
+            SELECT m.name, p.cid, p.name, p.type, p."notnull",
+                   p.dflt_value, p.pk
+              FROM sqlite_master AS m
+              JOIN pragma_table_info(m.name) AS p
+             WHERE m.type = 'table'
+             ORDER BY m.rowid, p.cid
+        """)
+    else:
+        cur.execute("""
+            SELECT c.table_name, c.ordinal_position, c.column_name,
+                   c.data_type, c.is_nullable, c.column_default
+              FROM information_schema.columns AS c
+              JOIN pg_catalog.pg_tables AS t
+                ON c.table_schema = t.schemaname
+               AND c.table_name = t.tablename
+             WHERE c.table_schema = 'public'
+             ORDER BY c.table_name, c.ordinal_position
+        """)
+    columns = {}
+    for row in cur.fetchall():
+        columns.setdefault(row[0], []).append(tuple(row[1:]))
+    return columns
+
+
+def get_row_counts(conn, table_names, exact=False):
+    """Gets the number of rows in every table.
+
+    The approximate counts are read from the statistics (without table
+    scans):
+        - PostgreSQL: pg_class.reltuples,
+        - SQLite: sqlite_stat1 (after ANALYZE).
+    The tables without statistics, and all tables if exact is True,
+    are counted with COUNT(*).
+    """
+    counts = {} if exact else get_approximate_counts(conn, table_names)
+    cur = conn.cursor()
+    for table_name in table_names:
+        if counts.get(table_name) is None:
+            cur.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+            counts[table_name] = cur.fetchone()[0]
+    return {table_name: counts[table_name] for table_name in table_names}
+
+
+def get_approximate_counts(conn, table_names):
+    """Gets the row counts from the statistics (None if unknown)."""
+    cur = conn.cursor()
+    counts = dict.fromkeys(table_names)
+    if not is_sqlite(conn):
+        # reltuples is -1 if the table has never been analyzed.
+        cur.execute("""
+            SELECT c.relname, c.reltuples::BIGINT
+              FROM pg_catalog.pg_class AS c
+              JOIN pg_catalog.pg_namespace AS n
+                ON c.relnamespace = n.oid
+             WHERE n.nspname = 'public'
+               AND c.relkind IN ('r', 'p')
+               AND c.reltuples >= 0
+        """)
+        counts.update(
+            (table_name, count) for table_name, count in cur.fetchall()
+            if table_name in counts
+        )
+        return counts
+    cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    )
+    if cur.fetchone():
+        # The first number of stat is the number of rows.
+        cur.execute("SELECT tbl, stat FROM sqlite_stat1")
+        for table_name, stat in cur.fetchall():
+            if table_name in counts:
+                counts[table_name] = max(
+                    counts[table_name] or 0, int(stat.split()[0])
+                )
+    return counts
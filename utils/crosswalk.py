@@ -0,0 +1,345 @@
+# Import the bultin libraries.
+import logging
+import sys
+
+# Import the third-party libraries.
+import pandas as pd
+
+# Import the local/project packages, modules, and fucntions.
+from utils.data_exploration_p3 import match_players
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The columns of the basketball-reference players index. The slug is
+# the id of the player page (e.g. "abdelal01" of
+# /players/a/abdelal01.html), so it is stable between the scrapes.
+PLAYER_INFO_COLUMNS = [
+    "person_id", "slug", "name", "from_year", "to_year", "pos", "height",
+    "weight", "birth_date", "college"
+]
+
+# The players index used by notebook 05, where the person_id is the
+# row number (see load_legacy_person_ids).
+LEGACY_PLAYER_INFO = (
+    "csv/basketball_reference_com/df_player_info_20230823_120400.csv"
+)
+
+
+def create_crosswalk_tables(cur):
+    """Creates the crosswalk tables in the nba database in PostgreSQL.
+
+    Creates the 2 tables:
+        - player_info: the basketball-reference players index with the
+          person_id kept for the slug of the player (see
+          insert_player_info),
+        - player_crosswalk: the player_id (API) to person_id
+          (basketball-reference) mapping with the match method
+          ("name_years" or "manual") and the confidence (0-1).
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS player_info (
+               person_id  INTEGER PRIMARY KEY,
+               slug       TEXT,
+               name       TEXT,
+               from_year  INTEGER,
+               to_year    INTEGER,
+               pos        TEXT,
+               height     TEXT,
+               weight     REAL,
+               birth_date DATE,
+               college    TEXT
+        )
+    """)
+    # The tables created before the slug was added.
+    cur.execute("ALTER TABLE player_info ADD COLUMN IF NOT EXISTS slug TEXT")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS player_info_slug_idx
+            ON player_info (slug)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS player_crosswalk (
+               player_id  INTEGER PRIMARY KEY,
+               person_id  INTEGER REFERENCES player_info (person_id),
+               method     TEXT,
+               confidence REAL,
+               updated_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS player_crosswalk_person_id_idx
+            ON player_crosswalk (person_id)
+    """)
+
+
+def prepare_player_info(df):
+    """Converts the players index to the types of the player_info table.
+
+    The empty and whitespace strings are missing values, the years and
+    the weight are numbers and the birth date is a date; the values
+    that cannot be converted are missing. Returns the DataFrame with
+    the PLAYER_INFO_COLUMNS except person_id.
+    """
+    df = df.reset_index(drop=True)
+    text = df.astype(str).apply(lambda column: column.str.strip())
+    df = df.mask(df.notna() & (text == ""))
+    df = df.assign(
+        name=df["name"].str.rstrip("*"),
+        from_year=pd.to_numeric(df["from_year"], errors="coerce").astype(
+            "Int64"
+        ),
+        to_year=pd.to_numeric(df["to_year"], errors="coerce").astype(
+            "Int64"
+        ),
+        weight=pd.to_numeric(df["weight"], errors="coerce"),
+        birth_date=pd.to_datetime(df["birth_date"], errors="coerce").dt.date
+    )
+    return df[PLAYER_INFO_COLUMNS[1:]]
+
+
+def load_legacy_person_ids(df, path=LEGACY_PLAYER_INFO):
+    """Gets the person_id of notebook 05 for the players of df.
+
+    The person_id of notebook 05 is the row number of the players index
+    saved in path, so it is found by the name, the years and the birth
+    date (the players with the same values in path are skipped). This
+    is needed once, to keep the ids of csv/manually_filtered_table.csv
+    valid when the player_info table is filled. Returns a Series like
+    df["slug"] with NaN for the players not found.
+    """
+    keys = ["name", "from_year", "to_year", "birth_date"]
+    legacy = prepare_player_info(
+        pd.read_csv(path).assign(slug=None)
+    ).reset_index(names="person_id")
+    legacy = legacy.drop_duplicates(subset=keys, keep=False)
+    return prepare_player_info(df)[keys].merge(
+        legacy[keys + ["person_id"]], on=keys, how="left"
+    )["person_id"].set_axis(df.index)
+
+
+def insert_player_info(cur, conn, df, person_ids=None):
+    """Inserts the basketball-reference players to the player_info table.
+
+    df is the result of data_collection.fetch_all_data (or its CSV),
+    converted by prepare_player_info. The players are keyed by the
+    slug: a player already in the table keeps its person_id, and a new
+    player gets the person_id from person_ids (see
+    load_legacy_person_ids) if it is not taken, or the next free one.
+    The players without the slug are skipped.
+    """
+    df = prepare_player_info(df).assign(
+        person_id=None if person_ids is None else person_ids.to_numpy()
+    )
+    missing = df["slug"].isna()
+    if missing.any():
+        logger.warning(f"{missing.sum()} players without the slug skipped.")
+        df = df[~missing]
+    cur.execute("SELECT slug, person_id FROM player_info")
+    saved = cur.fetchall()
+    # The rows saved before the slug was added can get the slug by the
+    # legacy person_id.
+    ids = {slug: id_ for slug, id_ in saved if slug is not None}
+    taken = set(ids.values())
+    next_id = max((id_ for _, id_ in saved), default=-1) + 1
+    person_id = []
+    for slug, legacy_id in zip(df["slug"], df["person_id"]):
+        if slug in ids:
+            new_id = ids[slug]
+        elif pd.notna(legacy_id) and int(legacy_id) not in taken:
+            new_id = int(legacy_id)
+        else:
+            new_id = next_id
+        taken.add(new_id)
+        ids[slug] = new_id
+        next_id = max(next_id, new_id + 1)
+        person_id.append(new_id)
+    df = df.assign(person_id=person_id)
+    # Replace NaN, NaT and NA with NULL.
+    rows = list(
+        df[PLAYER_INFO_COLUMNS].astype(object)
+        .where(df[PLAYER_INFO_COLUMNS].notna(), None)
+        .itertuples(index=False, name=None)
+    )
+    cur.executemany(f"""
+        INSERT INTO player_info ({", ".join(PLAYER_INFO_COLUMNS)})
+        VALUES ({", ".join(["%s"] * len(PLAYER_INFO_COLUMNS))})
+        ON CONFLICT (person_id) DO UPDATE
+           SET ({", ".join(PLAYER_INFO_COLUMNS[1:])}) = ROW({", ".join(
+               f"EXCLUDED.{column}" for column in PLAYER_INFO_COLUMNS[1:])})
+    """, rows)
+    conn.commit()
+    logger.info(f"{len(rows)} players have been inserted to player_info.")
+
+
+def load_manual_matches(path="csv/manually_filtered_table.csv"):
+    """Loads the manually checked pairs of notebook 05.
+
+    Returns a DataFrame with the player_id and person_id columns. The
+    person_id is NaN for the players without a correct pair.
+    """
+    df = pd.read_csv(
+        filepath_or_buffer=path,
+        delimiter=";",
+        usecols=list(range(1, 10))
+    )
+    correct = (
+        df[df["status"] == "correct"]
+        .drop_duplicates(subset=["player_id"])
+        .set_index("player_id")["person_id"]
+    )
+    players = df[["player_id"]].drop_duplicates().reset_index(drop=True)
+    return players.assign(person_id=players["player_id"].map(correct))
+
+
+def refresh_crosswalk(cur, conn, manual=None, tolerance=1, margin=0.1):
+    """Matches the API players with basketball-reference and saves it.
+
+    The API careers are read from the player_careers table (see
+    fact_tables.refresh_fact_tables) and matched with player_info by
+    data_exploration_p3.match_players; the score is the confidence.
+    The manual DataFrame (see load_manual_matches) overrides the
+    automatic matches: its pairs are saved with the "manual" method and
+    its players without a pair are removed. The ambiguous players are
+    not saved, and the earlier automatic pairs that are not matched now
+    are removed. Returns the matched, ambiguous and unmatched DFs.
+    """
+    cur.execute("""
+        SELECT p.id AS player_id,
+               p.first_name || ' ' || p.last_name AS name,
+               c.from_year,
+               c.to_year
+          FROM players AS p
+          JOIN player_careers AS c
+            ON p.id = c.player_id
+    """)
+    df_api = pd.DataFrame(
+        cur.fetchall(), columns=["player_id", "name", "from_year", "to_year"]
+    )
+    cur.execute("SELECT person_id, name, from_year, to_year FROM player_info")
+    df_ref = pd.DataFrame(
+        cur.fetchall(), columns=["person_id", "name", "from_year", "to_year"]
+    )
+    matched, ambiguous, unmatched = match_players(
+        df_api, df_ref, tolerance=tolerance, margin=margin
+    )
+    rows = matched[["player_id", "person_id", "score"]].assign(
+        method="name_years"
+    )
+    if manual is not None:
+        rows = rows[~rows["player_id"].isin(manual["player_id"])]
+        manual_rows = manual.dropna(subset=["person_id"]).assign(
+            score=1.0, method="manual"
+        )
+        rows = pd.concat([rows, manual_rows], ignore_index=True)
+        cur.execute(
+            "DELETE FROM player_crosswalk WHERE player_id = ANY(%s)",
+            (manual["player_id"].astype(int).tolist(),)
+        )
+    # Remove the automatic pairs that are no longer matched (ambiguous
+    # or unmatched now).
+    cur.execute("""
+        DELETE FROM player_crosswalk
+         WHERE method = 'name_years'
+           AND NOT player_id = ANY(%s)
+    """, (rows["player_id"].astype(int).tolist(),))
+    cur.executemany("""
+        INSERT INTO player_crosswalk (
+               player_id, person_id, method, confidence
+        )
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (player_id) DO UPDATE
+           SET person_id = EXCLUDED.person_id,
+               method = EXCLUDED.method,
+               confidence = EXCLUDED.confidence,
+               updated_at = now()
+    """, list(zip(
+        rows["player_id"].astype(int).tolist(),
+        rows["person_id"].astype(int).tolist(),
+        rows["method"],
+        rows["score"].astype(float).tolist()
+    )))
+    conn.commit()
+    logger.info(
+        f"The crosswalk has been refreshed: {len(rows)} players, "
+        f"{len(ambiguous['player_id'].unique())} ambiguous, "
+        f"{len(unmatched)} unmatched."
+    )
+    return matched, ambiguous, unmatched
+
+
+def get_person_id(cur, player_id):
+    """Gets the basketball-reference id of the API player (or None)."""
+    cur.execute(
+        "SELECT person_id FROM player_crosswalk WHERE player_id = %s",
+        (player_id,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def get_player_ids(cur, person_id):
+    """Gets the API ids of the basketball-reference player."""
+    cur.execute(
+        "SELECT player_id FROM player_crosswalk WHERE person_id = %s",
+        (person_id,)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def load_crosswalk(con):
+    """Loads the whole crosswalk as a DataFrame."""
+    return pd.read_sql_query("SELECT * FROM player_crosswalk", con)
+
+
+def load_player_dataset(con, first_season=1983, last_season=2023,
+                        min_confidence=0.0):
+    """Loads the player-game rows with the basketball-reference data.
+
+    This is the result DataFrame of notebook 05: the fact tables (see
+    fact_tables.load_player_games) joined with player_info through the
+    crosswalk in one query, instead of the manual merges. The players
+    without a match have NULL basketball-reference columns.
+    """
+    query = """
+        SELECT f.*,
+               c.from_year,
+               c.to_year,
+               x.person_id,
+               x.confidence,
+               i.name,
+               i.pos,
+               i.height,
+               i.weight,
+               i.birth_date,
+               i.college
+          FROM player_game_facts AS f
+          JOIN player_careers AS c
+            ON f.player_id = c.player_id
+          LEFT JOIN player_crosswalk AS x
+            ON f.player_id = x.player_id
+           AND x.confidence >= %(min_confidence)s
+          LEFT JOIN player_info AS i
+            ON x.person_id = i.person_id
+         WHERE f.season BETWEEN %(first_season)s AND %(last_season)s
+    """
+    df = pd.read_sql_query(
+        query,
+        con,
+        params={
+            "first_season": first_season,
+            "last_season": last_season,
+            "min_confidence": min_confidence
+        },
+        parse_dates=["birth_date"]
+    )
+    return df.drop(columns="stat_id")
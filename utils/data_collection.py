@@ -1,15 +1,27 @@
 # Import the bultin libraries.
+import glob
 import logging
 import random
+import queue
 import string
 import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # Import the third-party libraries.
 from bs4 import BeautifulSoup
 import pandas as pd
 import requests
 
+# Import the local/project packages, modules, and fucntions.
+from utils.crosswalk import (
+    create_crosswalk_tables,
+    insert_player_info,
+    refresh_crosswalk
+)
+from utils.http_client import get_session
+
 
 # Set logger
 logger = logging.getLogger(__name__)
@@ -25,7 +37,247 @@ logger.addHandler(handler)
 
 ########################################################################
 # https://www.balldontlie.io/
-def create_tables(cur):
+STATS_URL = "https://www.balldontlie.io/api/v1/stats"
+
+
+# The columns and types of the staging tables used by copy_data. The
+# percentages are copied as float8 and cast to NUMERIC on the merge.
+STAGING_COLUMNS = {
+    "games": (
+        ("id", "int4"),
+        ("date", "timestamp"),
+        ("home_team_id", "int4"),
+        ("home_team_score", "int4"),
+        ("season", "int4"),
+        ("visitor_team_id", "int4"),
+        ("visitor_team_score", "int4")
+    ),
+    "players": (
+        ("id", "int4"),
+        ("first_name", "text"),
+        ("last_name", "text"),
+        ("position", "text"),
+        ("team_id", "int4")
+    ),
+    "stats": (
+        ("id", "int4"),
+        ("game_id", "int4"),
+        ("team_id", "int4"),
+        ("player_id", "int4"),
+        ("ast", "int4"),
+        ("blk", "int4"),
+        ("dreb", "int4"),
+        ("fg3_pct", "float8"),
+        ("fg3a", "int4"),
+        ("fg3m", "int4"),
+        ("fg_pct", "float8"),
+        ("fga", "int4"),
+        ("fgm", "int4"),
+        ("ft_pct", "float8"),
+        ("fta", "int4"),
+        ("ftm", "int4"),
+        ("min", "text"),
+        ("oreb", "int4"),
+        ("pf", "int4"),
+        ("pts", "int4"),
+        ("reb", "int4"),
+        ("stl", "int4"),
+        ("turnover", "int4")
+    )
+}
+
+
+class RateLimiter:
+    """Limits a rate of API requests shared by several threads.
+
+    The token bucket is refilled with requests_per_minute tokens per
+    minute and holds up to burst tokens. Every request takes one token
+    and waits if the bucket is empty.
+    """
+
+    def __init__(self, requests_per_minute=60, burst=1):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token from the bucket, waits if it is empty."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# The columns and types of the stats staging table for the optimized
+# schema (see create_tables): the season is added, the minutes are
+# parsed to seconds and the counting stats are SMALLINT.
+OPTIMIZED_STATS_COLUMNS = (
+    ("id", "int4"),
+    ("season", "int2"),
+    ("game_id", "int4"),
+    ("team_id", "int4"),
+    ("player_id", "int4"),
+    ("ast", "int2"),
+    ("blk", "int2"),
+    ("dreb", "int2"),
+    ("fg3_pct", "float4"),
+    ("fg3a", "int2"),
+    ("fg3m", "int2"),
+    ("fg_pct", "float4"),
+    ("fga", "int2"),
+    ("fgm", "int2"),
+    ("ft_pct", "float4"),
+    ("fta", "int2"),
+    ("ftm", "int2"),
+    ("min_seconds", "int4"),
+    ("oreb", "int2"),
+    ("pf", "int2"),
+    ("pts", "int2"),
+    ("reb", "int2"),
+    ("stl", "int2"),
+    ("turnover", "int2")
+)
+
+
+def staging_columns(table, optimized=False):
+    """Gets the staging columns and types of the table."""
+    if optimized and table == "stats":
+        return OPTIMIZED_STATS_COLUMNS
+    return STAGING_COLUMNS[table]
+
+
+def conflict_target(table, optimized=False):
+    """Gets the ON CONFLICT target of the table.
+
+    The primary key of the partitioned stats table includes the
+    partition key (season).
+    """
+    if optimized and table == "stats":
+        return "(id, season)"
+    return "(id)"
+
+
+def parse_minutes(value):
+    """Converts the minutes like "34:12" or "34" to seconds.
+
+    Returns None for empty or malformed values.
+    """
+    if not value:
+        return None
+    minutes, _, seconds = str(value).partition(":")
+    try:
+        return round(float(minutes) * 60) + (int(seconds) if seconds else 0)
+    except ValueError:
+        return None
+
+
+class IdIndex:
+    """Stores a set of integer ids as a bitmap.
+
+    The index is used to drop the games and players that have already
+    been sent to the DB. One bit per id keeps the index compact (the
+    ids below 50 millions take about 6 MB), and the bitmap grows when a
+    larger id is added. The added and suppressed counters show how
+    many rows are passed and dropped by filter_rows.
+    """
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.added = 0
+        self.suppressed = 0
+
+    def __contains__(self, id_):
+        byte = id_ >> 3
+        return (byte < len(self.bits)
+                and bool(self.bits[byte] & (1 << (id_ & 7))))
+
+    def add(self, id_):
+        """Adds the id, returns False if it is already in the index."""
+        byte = id_ >> 3
+        if byte >= len(self.bits):
+            # Grow at least twice to avoid frequent reallocation.
+            size = max(byte + 1, 2 * len(self.bits))
+            self.bits.extend(bytes(size - len(self.bits)))
+        mask = 1 << (id_ & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        return True
+
+    def filter_rows(self, rows):
+        """Returns the rows whose ids are not in the index yet."""
+        new_rows = [row for row in rows if self.add(row["id"])]
+        self.added += len(new_rows)
+        self.suppressed += len(rows) - len(new_rows)
+        return new_rows
+
+    def discard_rows(self, rows):
+        """Removes the ids of the rows returned by filter_rows.
+
+        Used if the rows have not been saved in the DB, so they are
+        passed again by the next batch.
+        """
+        for row in rows:
+            id_ = row["id"]
+            if id_ in self:
+                self.bits[id_ >> 3] &= ~(1 << (id_ & 7)) & 0xFF
+        self.added -= len(rows)
+
+    def warm(self, cur, table):
+        """Adds the primary keys of the table in the DB."""
+        cur.execute(f"SELECT id FROM {table}")
+        while True:
+            ids = cur.fetchmany(100000)
+            if not ids:
+                break
+            for (id_,) in ids:
+                self.add(id_)
+
+
+def create_id_indexes(cur=None):
+    """Creates the IdIndex dict for the games and players tables.
+
+    If the cursor is given, the indexes are warmed with the ids already
+    in the DB.
+    """
+    indexes = {"games": IdIndex(), "players": IdIndex()}
+    if cur is not None:
+        for table, index in indexes.items():
+            index.warm(cur, table)
+    return indexes
+
+
+def log_id_indexes(indexes):
+    """Logs the passed and suppressed rows of the indexes."""
+    for table, index in indexes.items():
+        logger.info(
+            f"The {table} rows: {index.added} passed, {index.suppressed} "
+            f"suppressed as duplicates."
+        )
+
+
+def forget_rows(indexes, games, players):
+    """Removes the games and players of a failed batch from the indexes.
+
+    The rows are marked as seen when their batch is inserted, so they
+    are unmarked if the batch is not saved in the DB.
+    """
+    indexes["games"].discard_rows(games)
+    indexes["players"].discard_rows(players)
+
+
+def create_tables(cur, optimized=False):
     """ Creates creates in the nba database in PostgreSQL.
 
     Creates the 4 tables in the nba database:
@@ -34,6 +286,15 @@ def create_tables(cur):
         - players,
         - stats.
     The column names are based on the JSON-file received over the API.
+    Also, creates the checkpoints table that stores the last saved
+    page of every season.
+
+    If optimized is True, the stats table uses compact types: SMALLINT
+    for the counting stats, REAL for the percentages, and the minutes
+    are stored as seconds in min_seconds. Also, it gets the season
+    column and is partitioned by season (one partition per decade, see
+    create_stats_partitions). Create the indexes with create_indexes
+    after the bulk load.
     """
     # Create the teams table.
     cur.execute("""
@@ -72,39 +333,148 @@ def create_tables(cur):
                FOREIGN KEY (team_id) REFERENCES teams (id)
         )
     """)
-    # Create the stats table.
+    if optimized:
+        # Create the stats table.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                   id          INTEGER  NOT NULL,
+                   season      SMALLINT NOT NULL,
+                   game_id     INTEGER,
+                   team_id     INTEGER,
+                   player_id   INTEGER,
+                   ast         SMALLINT,
+                   blk         SMALLINT,
+                   dreb        SMALLINT,
+                   fg3_pct     REAL,
+                   fg3a        SMALLINT,
+                   fg3m        SMALLINT,
+                   fg_pct      REAL,
+                   fga         SMALLINT,
+                   fgm         SMALLINT,
+                   ft_pct      REAL,
+                   fta         SMALLINT,
+                   ftm         SMALLINT,
+                   min_seconds INTEGER,
+                   oreb        SMALLINT,
+                   pf          SMALLINT,
+                   pts         SMALLINT,
+                   reb         SMALLINT,
+                   stl         SMALLINT,
+                   turnover    SMALLINT,
+                   PRIMARY KEY (id, season),
+                   FOREIGN KEY (game_id) REFERENCES games (id),
+                   FOREIGN KEY (team_id) REFERENCES teams (id),
+                   FOREIGN KEY (player_id) REFERENCES players (id)
+            ) PARTITION BY RANGE (season)
+        """)
+        create_stats_partitions(cur)
+    else:
+        # Create the stats table.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                   id        INTEGER PRIMARY KEY,
+                   game_id   INTEGER,
+                   team_id   INTEGER,
+                   player_id INTEGER,
+                   ast       INTEGER,
+                   blk       INTEGER,
+                   dreb      INTEGER,
+                   fg3_pct   NUMERIC,
+                   fg3a      INTEGER,
+                   fg3m      INTEGER,
+                   fg_pct    NUMERIC,
+                   fga       INTEGER,
+                   fgm       INTEGER,
+                   ft_pct    NUMERIC,
+                   fta       INTEGER,
+                   ftm       INTEGER,
+                   min       TEXT,
+                   oreb      INTEGER,
+                   pf        INTEGER,
+                   pts       INTEGER,
+                   reb       INTEGER,
+                   stl       INTEGER,
+                   turnover  INTEGER,
+                   FOREIGN KEY (game_id) REFERENCES games (id),
+                   FOREIGN KEY (team_id) REFERENCES teams (id),
+                   FOREIGN KEY (player_id) REFERENCES players (id)
+            )
+        """)
+    # Create the checkpoints table.
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS stats (
-               id        INTEGER PRIMARY KEY,
-               game_id   INTEGER,
-               team_id   INTEGER,
-               player_id INTEGER,
-               ast       INTEGER,
-               blk       INTEGER,
-               dreb      INTEGER,
-               fg3_pct   NUMERIC,
-               fg3a      INTEGER,
-               fg3m      INTEGER,
-               fg_pct    NUMERIC,
-               fga       INTEGER,
-               fgm       INTEGER,
-               ft_pct    NUMERIC,
-               fta       INTEGER,
-               ftm       INTEGER,
-               min       TEXT,
-               oreb      INTEGER,
-               pf        INTEGER,
-               pts       INTEGER,
-               reb       INTEGER,
-               stl       INTEGER,
-               turnover  INTEGER,
-               FOREIGN KEY (game_id) REFERENCES games (id),
-               FOREIGN KEY (team_id) REFERENCES teams (id),
-               FOREIGN KEY (player_id) REFERENCES players (id)
+        CREATE TABLE IF NOT EXISTS checkpoints (
+               season      INTEGER PRIMARY KEY,
+               last_page   INTEGER,
+               total_pages INTEGER,
+               updated_at  TIMESTAMP
         )
     """)
 
 
+def create_stats_partitions(cur, first_season=1940, last_season=2039):
+    """Creates a partition of the optimized stats table per decade.
+
+    The seasons out of the range go to the default partition.
+    """
+    for decade in range(first_season // 10 * 10, last_season + 1, 10):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS stats_{decade}s
+            PARTITION OF stats
+            FOR VALUES FROM ({decade}) TO ({decade + 10})
+        """)
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS stats_default PARTITION OF stats DEFAULT"
+    )
+
+
+def create_indexes(cur):
+    """Creates the indexes used by the analytical queries.
+
+    Call the function after the bulk load because the indexes slow
+    down the insertion. The indexes of the partitioned stats table are
+    created on every partition.
+    """
+    indexes = {
+        "stats_game_id_idx": "stats (game_id)",
+        "stats_player_id_idx": "stats (player_id)",
+        "stats_team_id_idx": "stats (team_id)",
+        "games_season_idx": "games (season)",
+        "games_date_idx": "games (date)",
+        "players_team_id_idx": "players (team_id)"
+    }
+    for name, definition in indexes.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+        logger.info(f"The index {name} has been created.")
+    # Update the statistics for the planner.
+    cur.execute("ANALYZE games, players, stats")
+
+
+def save_checkpoint(cur, season, last_page, total_pages):
+    """Saves the last inserted page of the season.
+
+    The function does not commit, so the checkpoint is saved in the
+    same transaction as the batch.
+    """
+    cur.execute("""
+        INSERT INTO checkpoints (season, last_page, total_pages, updated_at)
+        VALUES (%(season)s, %(last_page)s, %(total_pages)s, now())
+        ON CONFLICT (season) DO UPDATE
+           SET last_page = EXCLUDED.last_page,
+               total_pages = EXCLUDED.total_pages,
+               updated_at = EXCLUDED.updated_at
+    """, {"season": season, "last_page": last_page,
+          "total_pages": total_pages})
+
+
+def get_checkpoints(cur):
+    """Gets a dict of (last_page, total_pages) tuples by season."""
+    cur.execute("SELECT season, last_page, total_pages FROM checkpoints")
+    return {
+        season: (last_page, total_pages)
+        for season, last_page, total_pages in cur.fetchall()
+    }
+
+
 def get_table_names(cur):
     """Gets the table names in the nba database."""
     # Execute the query to get all table names.
@@ -124,16 +494,19 @@ def get_table_names(cur):
     logger.info(f"The following tables have been created: {tab_names}.")
 
 
-def insert_data_to_teams(cur, conn):
+def insert_data_to_teams(cur, conn, session=None):
     """Retrieves and inserts data from API to the teams table.
 
     The function retrieves, inserts the data and save changes in the DB.
     A number of teams is small, and we want to avoid violation of key
     constraints. Therefore, populate all the table.
+    The requests are sent by the session (see http_client.CachedSession),
+    the shared session is used by default.
     """
+    session = session or get_session()
     # Retrieve the teams data.
     try:
-        response = requests.get(
+        response = session.get(
             url="https://www.balldontlie.io/api/v1/teams",
             params={"per_page": 100}
         )
@@ -182,7 +555,98 @@ def insert_data_to_teams(cur, conn):
     logger.info("The changes in the DB have been saved.")
 
 
-def get_data(cur, conn, seasons, start_page=1):
+def fetch_stats_page(url, seasons, page, per_page=100, limiter=None,
+                     params=None, session=None, use_cache=True):
+    """Retrieves one page of the stats endpoint.
+
+    If the limiter is given, the function waits for its token before
+    a request to the API; a page replayed from the cache does not
+    wait. The params dict adds other filters of the endpoint
+    (e.g. start_date), and seasons can be None if they are not
+    filtered. The request is sent by the session (the shared session
+    by default), which retries it and caches the response if use_cache
+    is True. It raises requests.RequestException if the request fails.
+    """
+    session = session or get_session()
+    params = {"page": page, "per_page": per_page, **(params or {})}
+    if seasons is not None:
+        params["seasons[]"] = seasons
+    if limiter is not None and not (
+        use_cache and session.is_cached(url, params)
+    ):
+        limiter.acquire()
+    # Send an HTTP GET request to the API endpoint and check the status.
+    response = session.get(url, params=params, use_cache=use_cache)
+    response.raise_for_status()
+    logger.debug(f"Successful API call to the stats endpoint, "
+                 f"request page {page} for season {seasons}.")
+    # Get json/dict from the response.
+    return response.json()
+
+
+def split_stats_page(data):
+    """Splits a page of the stats endpoint into the table rows.
+
+    Returns a tuple of lists of dicts for the games, players and stats
+    tables. The stats rows also have the season and min_seconds keys
+    used by the optimized schema.
+    """
+    games = []
+    players = []
+    stats = []
+    for item in data["data"]:
+        games.append(item["game"])
+        # Use team_id from "team" rather than "player" because
+        # some players played for several teams in one season. So,
+        # we use the current team. Also, we use "if" because the
+        # value of some item["player"] is None.
+        if item["player"]:
+            players.append(
+                {
+                    "id": item["player"]["id"],
+                    "first_name": item["player"]["first_name"],
+                    "last_name": item["player"]["last_name"],
+                    "position": item["player"]["position"] or None,
+                    "team_id": item["team"]["id"]
+                }
+            )
+            # Describe every key because we exclude team, game,
+            # and player and add the foreign keys for these columns.
+            stats.append(
+                {
+                    "id": item["id"],
+                    "season": item["game"]["season"],
+                    "game_id": item["game"]["id"],
+                    "team_id": item["team"]["id"],
+                    "player_id": item["player"]["id"],
+                    "ast": item["ast"],
+                    "blk": item["blk"],
+                    "dreb": item["dreb"],
+                    "fg3_pct": item["fg3_pct"],
+                    "fg3a": item["fg3a"],
+                    "fg3m": item["fg3m"],
+                    "fg_pct": item["fg_pct"],
+                    "fga": item["fga"],
+                    "fgm": item["fgm"],
+                    "ft_pct": item["ft_pct"],
+                    "fta": item["fta"],
+                    "ftm": item["ftm"],
+                    "min": item["min"],
+                    "min_seconds": parse_minutes(item["min"]),
+                    "oreb": item["oreb"],
+                    "pf": item["pf"],
+                    "pts": item["pts"],
+                    "reb": item["reb"],
+                    "stl": item["stl"],
+                    "turnover": item["turnover"]
+                }
+            )
+    return games, players, stats
+
+
+def get_data(cur, conn, seasons, start_page=1, url=STATS_URL, limiter=None,
+             insert_method="executemany", resume=False, session=None,
+             seen=None, optimized=False):
     """Gets data over API and insert it to the DB.
 
     This function:
@@ -190,12 +654,34 @@ def get_data(cur, conn, seasons, start_page=1):
         - Create the batches.
         - Call the insert_data function to insert the batches.
         - Save changes in the DB after every batch insertion.
+    The insert_method and optimized parameters are passed to
+    insert_data, and session to fetch_stats_page.
+
+    Every batch is saved together with the checkpoint of the season
+    (see save_checkpoint), and the retrieved pages are saved before
+    exiting if the API request fails. If resume is True, the function
+    skips a finished season and starts from the next uncommitted page
+    instead of start_page.
+
+    The games and players already sent to the DB are dropped by the
+    seen dict of IdIndex (see create_id_indexes) when a batch is
+    inserted, and they are marked as seen only if the batch is saved.
+    Pass the same dict to several calls to drop them for the whole
+    backfill.
     """
-    # Set the API endpoint URL
-    url = "https://www.balldontlie.io/api/v1/stats"
+    seen = create_id_indexes() if seen is None else seen
     # Set the initial page number and per_page parameters.
     page = start_page
     per_page = 100
+    if resume:
+        checkpoint = get_checkpoints(cur).get(seasons)
+        if checkpoint is not None:
+            last_page, total_pages = checkpoint
+            if last_page >= total_pages:
+                logger.info(f"Season {seasons} has been already retrieved.")
+                return
+            page = last_page + 1
+            logger.info(f"Resume Season {seasons} from page {page}.")
     # Create empty lists to store the data for every table.
     games_buffer = []
     players_buffer = []
@@ -203,96 +689,66 @@ def get_data(cur, conn, seasons, start_page=1):
     # Create a counter for the number of pages retrieved in the
     # current batch.
     pages_in_batch = 0
+    total_pages = None
+
+    def save_batch(last_page):
+        """Inserts the batch, the checkpoint and saves changes."""
+        games = seen["games"].filter_rows(games_buffer)
+        players = seen["players"].filter_rows(players_buffer)
+        try:
+            insert_data(
+                cur, (games, players, stats_buffer), insert_method, optimized
+            )
+            save_checkpoint(cur, seasons, last_page, total_pages)
+            logger.info(
+                f"The data (Season {seasons}: "
+                f"{last_page - pages_in_batch + 1}-{last_page} pages) have "
+                f"been inserted into the games, players, and stats tables."
+            )
+            # Save changes in the DB.
+            conn.commit()
+        except Exception:
+            forget_rows(seen, games, players)
+            raise
+        logger.info(
+            f"The changes in the games, players and stats tables have been"
+            f" saved (Season {seasons}: {last_page - pages_in_batch + 1}-"
+            f"{last_page} pages)."
+        )
+
     while True:
-        params = {"page": page, "per_page": per_page, "seasons[]": seasons}
         try:
-            # Send an HTTP GET request to the API endpoint and check
-            # the status.
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            logger.debug(f"Successful API call to the stats endpoint, "
-                         f"request page {page} for season {seasons}.")
-            # Get json/dict from the response.
-            data = response.json()
-            # logger.debug(f"{data}")
+            data = fetch_stats_page(
+                url, seasons, page, per_page, limiter, session=session
+            )
         except requests.RequestException as e:
             logger.error(f"API requests failed: {e}.")
+            # Save the pages retrieved before the failure.
+            if pages_in_batch:
+                save_batch(page - 1)
             raise SystemExit("API request failed. Exiting program.")
+        total_pages = data["meta"]["total_pages"]
         # Create a list of dicts for every table.
-        for item in data["data"]:
-            games_buffer.append(item["game"])
-            # Use team_id from "team" rather than "player" because
-            # some players played for several teams in one season. So,
-            # we use the current team. Also, we use "if" because the
-            # value of some item["player"] is None.
-            if item["player"]:
-                players_buffer.append(
-                    {
-                        "id": item["player"]["id"],
-                        "first_name": item["player"]["first_name"],
-                        "last_name": item["player"]["last_name"],
-                        "position": item["player"]["position"] or None,
-                        "team_id": item["team"]["id"]
-                    }
-                )
-                # Describe every key because we exclude team, game,
-                # and player and add the foreign keys for these columns.
-                stats_buffer.append(
-                    {
-                        "id": item["id"],
-                        "game_id": item["game"]["id"],
-                        "team_id": item["team"]["id"],
-                        "player_id": item["player"]["id"],
-                        "ast": item["ast"],
-                        "blk": item["blk"],
-                        "dreb": item["dreb"],
-                        "fg3_pct": item["fg3_pct"],
-                        "fg3a": item["fg3a"],
-                        "fg3m": item["fg3m"],
-                        "fg_pct": item["fg_pct"],
-                        "fga": item["fga"],
-                        "fgm": item["fgm"],
-                        "ft_pct": item["ft_pct"],
-                        "fta": item["fta"],
-                        "ftm": item["ftm"],
-                        "min": item["min"],
-                        "oreb": item["oreb"],
-                        "pf": item["pf"],
-                        "pts": item["pts"],
-                        "reb": item["reb"],
-                        "stl": item["stl"],
-                        "turnover": item["turnover"]
-                    }
-                )
+        games, players, stats = split_stats_page(data)
+        games_buffer.extend(games)
+        players_buffer.extend(players)
+        stats_buffer.extend(stats)
         pages_in_batch += 1
-        # If 10 pages retrieved or we're on the last page, insert the
+        # If 50 pages retrieved or we're on the last page, insert the
         # data and reset buffers.
-        if pages_in_batch == 50 or page == data["meta"]["total_pages"]:
+        if pages_in_batch == 50 or page >= total_pages:
             # Insert a batch.
-            insert_data(cur, (games_buffer, players_buffer, stats_buffer))
-            logger.info(
-                f"The data (Season {seasons}: {page - pages_in_batch + 1}"
-                f"-{page} pages) have been inserted into the games, players, "
-                f"and stats tables."
-            )
-            # Save changes in the DB.
-            conn.commit()
-            logger.info(
-                f"The changes in the games, players and stats tables have been"
-                f" saved (Season {seasons}: {page - pages_in_batch + 1}-"
-                f"{page} pages)."
-            )
+            save_batch(page)
             # Reset the buffers and counter.
             games_buffer = []
             players_buffer = []
             stats_buffer = []
             pages_in_batch = 0
             logger.debug("The table buffers have been cleared.")
-        # Check the page number and use 1 sec delay (not more than
-        # 60 API requests per minute.)
-        if data["meta"]["current_page"] < data["meta"]["total_pages"]:
+        # Check the page number. The delay between requests (not more
+        # than 60 API requests per minute) is set by the limiter.
+        if data["meta"]["current_page"] < total_pages:
             page += 1
-            # time.sleep(1)
             # logger.debug(f'Current page: {data["meta"]["current_page"]}')
             # logger.debug(f'Total pages: {data["meta"]["total_pages"]}')
         else:
@@ -300,11 +756,179 @@ def get_data(cur, conn, seasons, start_page=1):
                 f"The API requests have been completed. "
                 f"The last page for Season {seasons}: {page}."
             )
+            log_id_indexes(seen)
             break
 
 
-def insert_data(cur, buffers):
-    """Inserts data received over API to the nba database."""
+def get_data_concurrent(cur, conn, seasons, max_workers=4,
+                        requests_per_minute=60, url=STATS_URL,
+                        pages_in_batch=50, insert_method="executemany",
+                        resume=False, session=None, seen=None,
+                        optimized=False):
+    """Gets data for several seasons concurrently and inserts it to the DB.
+
+    Every season is fetched page by page in its own worker thread, and
+    max_workers sets how many seasons are fetched at the same time.
+    All workers share one RateLimiter, so the API budget
+    (requests_per_minute) is respected for the whole run. The pages
+    are passed to the calling thread through a bounded queue, and only
+    the calling thread uses the cursor: it buffers pages per season,
+    inserts a batch every pages_in_batch pages (or on the last page)
+    and saves changes in the DB after every batch. The insert_method
+    and optimized parameters are passed to insert_data, and session to
+    fetch_stats_page.
+
+    Every batch is saved together with the checkpoint of its season.
+    If resume is True, finished seasons are skipped and the others
+    start from the next uncommitted page. The seen dict of IdIndex
+    drops the duplicate games and players (see get_data).
+    """
+    seen = create_id_indexes() if seen is None else seen
+    # Set the first page for every season.
+    start_pages = {season: 1 for season in seasons}
+    if resume:
+        for season, (last_page, total_pages) in get_checkpoints(cur).items():
+            if season not in start_pages:
+                continue
+            if last_page >= total_pages:
+                logger.info(f"Season {season} has been already retrieved.")
+                del start_pages[season]
+            else:
+                start_pages[season] = last_page + 1
+    limiter = RateLimiter(requests_per_minute)
+    pages = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+    # The buffers of games, players, stats and the first page of the
+    # current batch for every season.
+    buffers = {}
+    # The last retrieved page and a total number of pages for every
+    # season.
+    progress = {}
+
+    def fetch_season(season):
+        """Retrieves all pages of the season and puts them to the queue."""
+        page = start_pages[season]
+        while not stop.is_set():
+            data = fetch_stats_page(
+                url, season, page, limiter=limiter, session=session
+            )
+            # Wait for free space in the queue, but do not block if the
+            # calling thread has stopped.
+            while not stop.is_set():
+                try:
+                    pages.put((season, page, data), timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            if data["meta"]["current_page"] >= data["meta"]["total_pages"]:
+                return
+            page += 1
+
+    def flush(season):
+        """Inserts the buffered pages of the season and saves changes."""
+        games, players, stats, first_page = buffers.pop(season)
+        last_page = progress[season][0]
+        # Drop the duplicates at the insertion (not in the buffer), so
+        # a player is inserted with the first saved batch that refers
+        # to the player, whatever season the batch belongs to.
+        games = seen["games"].filter_rows(games)
+        players = seen["players"].filter_rows(players)
+        try:
+            insert_data(
+                cur, (games, players, stats), insert_method, optimized
+            )
+            save_checkpoint(cur, season, last_page, progress[season][1])
+            conn.commit()
+        except Exception:
+            forget_rows(seen, games, players)
+            raise
+        logger.info(
+            f"The changes in the games, players and stats tables have been "
+            f"saved (Season {season}: {first_page}-{last_page} of "
+            f"{progress[season][1]} pages)."
+        )
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_season, season): season
+            for season in start_pages
+        }
+        try:
+            while True:
+                try:
+                    season, page, data = pages.get(timeout=0.5)
+                except queue.Empty:
+                    # Stop if no worker is running and the queue is
+                    # drained. The queue is checked after the workers,
+                    # since a worker can put its last page after get
+                    # has timed out.
+                    if (all(future.done() for future in futures)
+                            and pages.empty()):
+                        break
+                    continue
+                progress[season] = (page, data["meta"]["total_pages"])
+                games, players, stats = split_stats_page(data)
+                buffer = buffers.setdefault(season, ([], [], [], page))
+                buffer[0].extend(games)
+                buffer[1].extend(players)
+                buffer[2].extend(stats)
+                last_page = page >= data["meta"]["total_pages"]
+                if last_page or page - buffer[3] + 1 >= pages_in_batch:
+                    flush(season)
+                if last_page:
+                    logger.info(
+                        f"The API requests have been completed for Season "
+                        f"{season} ({page} pages). Completed seasons: "
+                        f"{sum(p == t for p, t in progress.values())}"
+                        f"/{len(start_pages)}."
+                    )
+        finally:
+            # Release the workers waiting for the queue.
+            stop.set()
+    for future, season in futures.items():
+        if future.exception() is not None:
+            failed[season] = future.exception()
+    # Save the pages retrieved before a failure.
+    for season in list(buffers):
+        flush(season)
+    log_id_indexes(seen)
+    if failed:
+        for season, e in failed.items():
+            logger.error(f"API requests failed for Season {season}: {e}.")
+        raise SystemExit("API request failed. Exiting program.")
+
+
+def insert_data(cur, buffers, method="executemany", optimized=False):
+    """Inserts data received over API to the nba database.
+
+    The method parameter selects the insertion path:
+        - "executemany" inserts the rows one by one,
+        - "copy" loads the rows with COPY into the staging tables and
+          merges them into the tables (see copy_data).
+    Returns a number of inserted rows per second, so both paths can be
+    compared. Set optimized to True if the tables have been created
+    with create_tables(cur, optimized=True).
+    """
+    start = time.perf_counter()
+    if method == "executemany":
+        insert_data_executemany(cur, buffers, optimized)
+    elif method == "copy":
+        copy_data(cur, buffers, optimized)
+    else:
+        raise ValueError(f"Unknown insertion method: {method}.")
+    elapsed = time.perf_counter() - start
+    num_rows = sum(len(buffer) for buffer in buffers)
+    rows_per_sec = num_rows / elapsed if elapsed else float("inf")
+    logger.debug(
+        f"{num_rows} rows have been inserted in {elapsed:.3f} s "
+        f"({rows_per_sec:.0f} rows/s, method {method})."
+    )
+    return rows_per_sec
+
+
+def insert_data_executemany(cur, buffers, optimized=False):
+    """Inserts data row by row using executemany."""
     games_query = ("""
         INSERT INTO games (
                id,
@@ -400,27 +1024,263 @@ def insert_data(cur, buffers):
         )
         ON CONFLICT (id) DO NOTHING
     """)
+    if optimized:
+        # The optimized stats table has other columns.
+        columns = [column for column, _ in OPTIMIZED_STATS_COLUMNS]
+        stats_query = (
+            f"INSERT INTO stats ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f'%({column})s' for column in columns)}) "
+            f"ON CONFLICT (id, season) DO NOTHING"
+        )
     cur.executemany(stats_query, buffers[2])
 
 
+def stage_rows(cur, table, rows, optimized=False):
+    """Copies the rows to the staging table of the table.
+
+    The staging table is a temporary table (see staging_columns) that
+    lives until the end of the session and is emptied at every commit.
+    The binary COPY format is used for players and stats. Games are
+    copied as text, so PostgreSQL parses the dates the same way as in
+    the executemany path.
+    """
+    table_columns = staging_columns(table, optimized)
+    columns = [column for column, _ in table_columns]
+    types = [column_type for _, column_type in table_columns]
+    # The optimized and usual stats are staged in different tables.
+    staging = f"staging_{table}_optimized" if optimized else f"staging_{table}"
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} ("
+        + ", ".join(f"{c} {t}" for c, t in table_columns)
+        + ") ON COMMIT DELETE ROWS"
+    )
+    cur.execute(f"TRUNCATE {staging}")
+    copy_format = "TEXT" if table == "games" else "BINARY"
+    with cur.copy(
+        f"COPY {staging} ({', '.join(columns)}) "
+        f"FROM STDIN (FORMAT {copy_format})"
+    ) as copy:
+        if copy_format == "BINARY":
+            copy.set_types(types)
+        for row in rows:
+            copy.write_row(tuple(row[column] for column in columns))
+    return staging
+
+
+def copy_data(cur, buffers, optimized=False):
+    """Inserts data using COPY into the staging tables.
+
+    The rows of every buffer are streamed to the staging table (see
+    stage_rows) and then merged into the table with one
+    INSERT ... SELECT ... ON CONFLICT (id) DO NOTHING.
+    """
+    for table, rows in zip(("games", "players", "stats"), buffers):
+        if not rows:
+            continue
+        staging = stage_rows(cur, table, rows, optimized)
+        column_list = ", ".join(
+            column for column, _ in staging_columns(table, optimized)
+        )
+        # DISTINCT ON removes the rows repeated in the batch (e.g. the
+        # game of every box score).
+        cur.execute(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT DISTINCT ON (id) {column_list}
+              FROM {staging}
+            ON CONFLICT {conflict_target(table, optimized)} DO NOTHING
+        """)
+
+
+def upsert_data(cur, buffers, optimized=False):
+    """Inserts new and updates changed rows of games and stats.
+
+    The rows are staged with COPY (see stage_rows). A row of games or
+    stats that already exists is updated only if any of its values
+    differs. Players are inserted with ON CONFLICT (id) DO NOTHING.
+    Returns a dict with the number of new, changed and unchanged rows
+    for games and stats.
+    """
+    counts = {}
+    for table, rows in zip(("games", "players", "stats"), buffers):
+        if not rows:
+            continue
+        staging = stage_rows(cur, table, rows, optimized)
+        columns = [column for column, _ in staging_columns(table, optimized)]
+        column_list = ", ".join(columns)
+        if table == "players":
+            cur.execute(f"""
+                INSERT INTO players ({column_list})
+                SELECT DISTINCT ON (id) {column_list}
+                  FROM {staging}
+                ON CONFLICT (id) DO NOTHING
+            """)
+            continue
+        values = [
+            column for column in columns if column not in ("id", "season")
+        ]
+        # The unchanged rows are not updated and not returned. The
+        # subqueries see the table before the insertion, so they count
+        # the rows that existed.
+        cur.execute(f"""
+              WITH upserted AS (
+            INSERT INTO {table} ({column_list})
+            SELECT DISTINCT ON (id) {column_list}
+              FROM {staging}
+            ON CONFLICT {conflict_target(table, optimized)} DO UPDATE
+               SET ({", ".join(values)}) = ROW({", ".join(
+                   f"EXCLUDED.{column}" for column in values)})
+             WHERE ({", ".join(f"{table}.{column}" for column in values)})
+                   IS DISTINCT FROM
+                   ({", ".join(f"EXCLUDED.{column}" for column in values)})
+            RETURNING 1)
+            SELECT (SELECT COUNT(*) FROM upserted),
+                   (SELECT COUNT(DISTINCT id) FROM {staging}),
+                   (SELECT COUNT(DISTINCT s.id)
+                      FROM {staging} AS s
+                      JOIN {table} AS t
+                        ON s.id = t.id)
+        """)
+        written, total, existing = cur.fetchone()
+        counts[table] = {
+            "new": total - existing,
+            "changed": written - (total - existing),
+            "unchanged": existing - (written - (total - existing))
+        }
+    return counts
+
+
+def sync_data(cur, conn, url=STATS_URL, limiter=None, start_date=None,
+              pages_in_batch=50, session=None, optimized=False):
+    """Gets only new and changed data over API and saves it in the DB.
+
+    By default, the stats are requested starting from the date of the
+    latest game in the games table (the day is requested again because
+    its box scores can be updated). Every batch is saved with
+    upsert_data, so the unchanged rows are not rewritten. The responses
+    are not cached because they must be up to date. Set optimized to
+    True for the optimized schema (see create_tables). Returns a
+    dict with the number of new, changed and unchanged rows for games
+    and stats.
+    """
+    if start_date is None:
+        cur.execute("SELECT MAX(date) FROM games")
+        latest = cur.fetchone()[0]
+        if latest is None:
+            raise ValueError(
+                "The games table is empty. Use get_data to load seasons."
+            )
+        start_date = latest.date().isoformat()
+    logger.info(f"Sync the stats from {start_date}.")
+    totals = {
+        table: {"new": 0, "changed": 0, "unchanged": 0}
+        for table in ("games", "stats")
+    }
+    page = 1
+    buffers = ([], [], [])
+    pages_in_buffer = 0
+    while True:
+        try:
+            data = fetch_stats_page(
+                url, None, page, limiter=limiter,
+                params={"start_date": start_date}, session=session,
+                use_cache=False
+            )
+        except requests.RequestException as e:
+            logger.error(f"API requests failed: {e}.")
+            raise SystemExit("API request failed. Exiting program.")
+        for buffer, rows in zip(buffers, split_stats_page(data)):
+            buffer.extend(rows)
+        pages_in_buffer += 1
+        last_page = data["meta"]["current_page"] >= data["meta"]["total_pages"]
+        if pages_in_buffer == pages_in_batch or last_page:
+            for table, counts in upsert_data(cur, buffers, optimized).items():
+                for key, value in counts.items():
+                    totals[table][key] += value
+            conn.commit()
+            logger.info(
+                f"The changes have been saved (pages {page} of "
+                f"{data['meta']['total_pages']}): {totals}."
+            )
+            buffers = ([], [], [])
+            pages_in_buffer = 0
+        if last_page:
+            break
+        page += 1
+    return totals
+
+
 ########################################################################
 # https://www.basketball-reference.com/
-def fetch_basketball_data(letter):
-    """Fetches basketball player data.
+PLAYERS_URL = "https://www.basketball-reference.com/players/{letter}"
+# The generated pages of players used by benchmark_parsers.
+PLAYER_PAGE_FIXTURES = "html/basketball_reference_com/players_*.html"
 
-     Fetches basketball player data based on the initial letter of
-     their surname.
-     """
+
+def fetch_player_page(letter, session=None):
+    """Fetches the HTML page of players for the letter.
+
+    Returns the page content or None if the request fails. The shared
+    session (see http_client.CachedSession) is used by default.
+    """
+    session = session or get_session()
     # Format the URL to get data for players with surnames starting
     # with the given letter.
-    url = f"https://www.basketball-reference.com/players/{letter}"
-    response = requests.get(url)
+    url = PLAYERS_URL.format(letter=letter)
+    try:
+        response = session.get(url)
+    except requests.RequestException as e:
+        logger.warning(f"Failed to fetch data for letter: {letter}: {e}.")
+        return None
     # Check if the request was successful.
     if response.status_code != 200:
         logger.warning(f"Failed to fetch data for letter: {letter}.")
         return None
+    return response.content
+
+
+# The data-stat attributes of the player page cells and the DataFrame
+# columns.
+PLAYER_STATS = {
+    "player": "name",
+    "year_min": "from_year",
+    "year_max": "to_year",
+    "pos": "pos",
+    "height": "height",
+    "weight": "weight",
+    "birth_date": "birth_date",
+    "colleges": "college"
+}
+
+
+def player_slug(attribute, href):
+    """Gets the id of the player page, e.g. abdelal01.
+
+    The id is the data-append-csv attribute of the player cell or the
+    file name of its link (/players/a/abdelal01.html). Returns None if
+    there is neither.
+    """
+    if attribute:
+        return attribute
+    if href:
+        return href.rsplit("/", 1)[-1].split(".", 1)[0]
+    return None
+
+
+def parse_player_page(content, parser="bs4"):
+    """Parses the HTML page of players to a DataFrame.
+
+    The slug column is the id of the player page (see player_slug).
+    The parser parameter selects the backend:
+        - "bs4" uses BeautifulSoup with html.parser,
+        - "lxml" uses lxml (see parse_player_page_lxml), which is much
+          faster and returns the same DataFrame.
+    """
+    if parser == "lxml":
+        return parse_player_page_lxml(content)
+    if parser != "bs4":
+        raise ValueError(f"Unknown parser: {parser}.")
     # Parse the HTML response content using BeautifulSoup.
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = BeautifulSoup(content, "html.parser")
     # Find the main table on the page.
     table = soup.find("table")
     # Fetch all the rows in the table skipping the header.
@@ -428,6 +1288,7 @@ def fetch_basketball_data(letter):
     # Create a dictionary to store extracted data. Every element of
     # the dict is a list.
     data = {
+        "slug": [],
         "name": [],
         "from_year": [],
         "to_year": [],
@@ -439,7 +1300,12 @@ def fetch_basketball_data(letter):
     }
     # Iterate over rows to extract player details.
     for row in rows:
-        data["name"].append(row.find("th", {"data-stat": "player"}).text)
+        player = row.find("th", {"data-stat": "player"})
+        link = player.find("a")
+        data["slug"].append(player_slug(
+            player.get("data-append-csv"), link and link.get("href")
+        ))
+        data["name"].append(player.text)
         data["from_year"].append(
             row.find("td", {"data-stat": "year_min"}).text
         )
@@ -452,31 +1318,166 @@ def fetch_basketball_data(letter):
         )
         data["college"].append(row.find("td", {"data-stat": "colleges"}).text)
     # Convert the dictionary to a Pandas DataFrame.
-    df = pd.DataFrame(data)
-    # Set random delays.
-    sleep_time = random.randint(60, 120)
-    time.sleep(sleep_time)
-    logger.info(
-        f"Fetch data for letter: {letter}. Waiting for {sleep_time} s ..."
-    )
+    return pd.DataFrame(data)
+
+
+def parse_player_page_lxml(content):
+    """Parses the HTML page of players to a DataFrame using lxml.
+
+    Every row is walked once: its cells are mapped by the data-stat
+    attribute and appended to the columns (see PLAYER_STATS).
+    """
+    # lxml is needed only for this parser.
+    try:
+        from lxml import html
+    except ImportError as e:
+        raise ImportError(
+            "The lxml parser needs lxml: pip install lxml, or use "
+            "parser='bs4'."
+        ) from e
+
+    # Find the main table on the page.
+    table = html.fromstring(content).find(".//table")
+    data = {"slug": [], **{column: [] for column in PLAYER_STATS.values()}}
+    columns = [(data[column], stat) for stat, column in PLAYER_STATS.items()]
+    # Iterate over the rows skipping the header.
+    rows = table.iter("tr")
+    next(rows, None)
+    for row in rows:
+        cells = {
+            cell.get("data-stat"): cell
+            for cell in row.iterchildren("th", "td")
+        }
+        player = cells["player"]
+        link = player.find("a")
+        data["slug"].append(player_slug(
+            player.get("data-append-csv"),
+            None if link is None else link.get("href")
+        ))
+        for values, stat in columns:
+            values.append(str(cells[stat].text_content()))
+    return pd.DataFrame(data)
+
+
+def benchmark_parsers(paths=None, repeat=5):
+    """Compares the parsers on the saved HTML pages of players.
+
+    Every page is parsed repeat times by every parser. The generated
+    pages of PLAYER_PAGE_FIXTURES are used by default. Returns a
+    DataFrame with the best time per page and parser, and checks that
+    both parsers return the same DataFrame.
+    """
+    if paths is None:
+        paths = sorted(glob.glob(PLAYER_PAGE_FIXTURES))
+    results = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        dfs = {}
+        for parser in ("bs4", "lxml"):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                dfs[parser] = parse_player_page(content, parser)
+                times.append(time.perf_counter() - start)
+            results.append({
+                "path": path,
+                "parser": parser,
+                "rows": len(dfs[parser]),
+                "best_s": min(times)
+            })
+        if not dfs["bs4"].equals(dfs["lxml"]):
+            raise AssertionError(f"The parsers return different data: {path}.")
+    df = pd.DataFrame(results)
+    logger.info(f"Parser benchmark:\n{df}")
     return df
 
 
-def fetch_all_data():
-    """Fetches basketball player data for all letters."""
+def fetch_basketball_data(letter, session=None, parser="bs4"):
+    """Fetches basketball player data.
+
+     Fetches basketball player data based on the initial letter of
+     their surname. The function sleeps after every downloaded page,
+     use fetch_all_data to fetch several letters. The parser parameter
+     is passed to parse_player_page.
+     """
+    session = session or get_session()
+    cached = session.is_cached(PLAYERS_URL.format(letter=letter))
+    content = fetch_player_page(letter, session)
+    if content is None:
+        return None
+    df = parse_player_page(content, parser)
+    # Set random delays if the page has been downloaded.
+    if not cached:
+        sleep_time = random.randint(60, 120)
+        time.sleep(sleep_time)
+        logger.info(
+            f"Fetch data for letter: {letter}. Waiting for {sleep_time} s ..."
+        )
+    return df
+
+
+def fetch_all_data(letters=string.ascii_lowercase, requests_per_minute=20,
+                   crawl_delay=3, max_workers=4, done=None, session=None,
+                   parser="bs4"):
+    """Fetches basketball player data for all letters.
+
+    The pages are requested one by one through a RateLimiter: not more
+    than requests_per_minute and not more often than every crawl_delay
+    seconds. Every downloaded page is parsed in a process pool
+    (max_workers) while the next pages are requested, so the total time
+    is bounded by the rate limit. The cached pages do not wait for the
+    limiter, and the letters in the done dict (letter: DataFrame) are
+    not fetched at all. The parsed letters are added to done, so the
+    dict can be passed again after a failure. The parser parameter is
+    passed to parse_player_page.
+    """
+    session = session or get_session()
+    done = {} if done is None else done
+    limiter = RateLimiter(min(requests_per_minute, 60 / crawl_delay))
+    futures = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Iterate over each letter of the alphabet.
+        for letter in letters:
+            if letter in done:
+                logger.debug(f"Skip letter: {letter}.")
+                continue
+            if not session.is_cached(PLAYERS_URL.format(letter=letter)):
+                limiter.acquire()
+            content = fetch_player_page(letter, session)
+            if content is not None:
+                futures[letter] = executor.submit(
+                    parse_player_page, content, parser
+                )
+                logger.info(f"Fetch data for letter: {letter}.")
+        for letter, future in futures.items():
+            done[letter] = future.result()
     # List to store DataFrames for each individual letter.
-    df_letters = []
-    # Iterate over each letter of the alphabet.
-    for letter in string.ascii_lowercase:
-        # Fetch player data for the given letter.
-        df_letter = fetch_basketball_data(letter)
-        if df_letter is not None:
-            df_letters.append(df_letter)
+    df_letters = [done[letter] for letter in letters if letter in done]
     # Combine all the individual DataFrames into one.
     result_df = pd.concat(df_letters, ignore_index=True)
     return result_df
 
 
+def save_player_info(cur, conn, df, manual=None, person_ids=None):
+    """Saves the players index and matches it with the API players.
+
+    df is the result of fetch_all_data (or its CSV). The crosswalk
+    tables are created if needed, df is inserted to player_info and
+    the crosswalk is refreshed (see crosswalk.refresh_crosswalk), so
+    the scraped players are linked right after the collection. The API
+    careers are read from player_careers, so the fact tables must be
+    refreshed first (see fact_tables.refresh_fact_tables). manual is
+    the DataFrame of crosswalk.load_manual_matches, and person_ids of
+    crosswalk.load_legacy_person_ids (needed once, see
+    crosswalk.insert_player_info). Returns the matched, ambiguous and
+    unmatched DFs.
+    """
+    create_crosswalk_tables(cur)
+    insert_player_info(cur, conn, df, person_ids)
+    return refresh_crosswalk(cur, conn, manual)
+
+
 def prepare_df(df):
     """Does transformations with df."""
     df['birth_date'] = pd.to_datetime(df['birth_date'])
@@ -7,11 +7,22 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import plotly.graph_objects as go
 # import plotly.io as pio
-from psycopg import sql
 import seaborn as sns
 # pio.renderers.default='jupyterlab'
 from ydata_profiling import ProfileReport
 
+from utils.catalog import get_catalog
+from utils.db_io import read_table
+from utils.profile_reports import (
+    create_reports_parallel,
+    in_notebook,
+    is_report_fresh,
+    report_path,
+    save_fingerprint,
+    table_fingerprint
+)
+from utils.sampling import sample_table
+
 # Set pandas
 pd.options.display.width = 200
 
@@ -27,55 +38,38 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
-def get_db_info(cur) -> Tuple[dict, pd.DataFrame]:
+def get_db_info(cur, exact=True,
+                refresh=False) -> Tuple[dict, pd.DataFrame]:
     """Creates a dict of DFs.
 
     Creates a dict of DFs, where the table name is the key and
     every column of DF is an information about column in DB (name,
     type, etc).
-    """
-    # Retrieve the table names.
-    cur.execute("""
-        SELECT tablename FROM pg_catalog.pg_tables
-         WHERE schemaname = 'public'
-    """)
 
-    table_names = [table_name[0] for table_name in cur.fetchall()]
+    The columns of all tables are read in one query and the numbers of
+    rows are counted; set exact to False to read the approximate ones
+    from the statistics (see catalog.get_catalog). The result is cached
+    for the connection; set refresh to reload it.
+    """
+    # Retrieve the columns and the row counts of all tables.
+    columns, row_counts = get_catalog(cur.connection, exact, refresh)
+    table_names = list(columns)
     logger.debug(f"Table names: {table_names}")
-    # Retrieve the table data and create a dictionary of dataframes.
+    # Create a dictionary of dataframes.
     db_info = {}
-    row_counts = []
-    for table_name in table_names:
-        query = """
-            SELECT ordinal_position, 
-                   column_name, 
-                   data_type, 
-                   is_nullable, 
-                   column_default
-              FROM information_schema.columns 
-             WHERE table_name = %(table_name)s;
-        """
-        params = {"table_name": table_name}
-        cur.execute(query, params)
-        table_info = cur.fetchall()
+    for table_name, table_info in columns.items():
         db_info[table_name] = pd.DataFrame(
             columns=[
                 "ID", "Column Name", "Type", "IS_NULLABLE", "DFLT_VALUE "
             ],
             data=table_info
         ).set_index("ID")
-        logger.debug(f"DB info: {db_info}")
-        # Count a number of rows in every table.
-        query = sql.SQL("""
-            SELECT COUNT(*)
-              FROM {}
-        """).format(sql.Identifier(table_name))
-        cur.execute(query)
-        row_counts.append(cur.fetchone()[0])
+    logger.debug(f"DB info: {db_info}")
     # Create the num_rows dataframe that will be used in plot-libraries.
     num_rows = pd.DataFrame(
         columns=["Table Name", "A num of rows"],
-        data=list(zip(table_names, row_counts))
+        data=[(table_name, row_counts[table_name])
+              for table_name in table_names]
     )#.set_index("Table Name")
     logger.debug(f"Dataframe with the table names and rows:  {num_rows}")
     # The info log message.
@@ -123,7 +117,9 @@ def print_db_info(db_info):
         print(f"Table columns:\n {column_names}\n")
 
 
-def create_reports(db_info, conn, excluded_tables, num_rows=100000) -> None:
+def create_reports(db_info, conn, excluded_tables, num_rows=100000,
+                   chunksize=None, seed=42, headless=None,
+                   force=False) -> None:
     """Creates reports using ydata_profiling.
 
     Creates the reports using ydata_profiling.
@@ -135,17 +131,43 @@ def create_reports(db_info, conn, excluded_tables, num_rows=100000) -> None:
 
     See also a list of excluded_tables inside functions. Add the
     tables here that have too many lines. The num_rows parameter will
-    be used only for "exlcuded" tables.
+    be used only for "exlcuded" tables. The rows are sampled with the
+    seed (see sampling.sample_table) instead of ORDER BY RANDOM(), so
+    the time depends on num_rows rather than the table size.
+
+    If chunksize is set, the tables are read in chunks of chunksize
+    rows with a server-side cursor and downcast dtypes (see
+    db_io.read_table), so the raw table is never kept in memory.
+
+    The widgets are rendered only in a notebook; set headless to
+    override it.
+
+    A fingerprint of the table (see profile_reports.table_fingerprint)
+    is saved next to every report, and the tables that have not
+    changed since their report are skipped unless force is True.
     """
+    if headless is None:
+        headless = not in_notebook()
     # excluded_tables = ["play_by_play"]
     empty_tables = []
+    cached_tables = []
     for table_name in db_info:
+        sample_rows = num_rows if table_name in excluded_tables else None
+        path = report_path("reports/04", table_name, sample_rows)
+        fingerprint = table_fingerprint(conn, table_name, sample_rows, seed)
+        # If the table has not changed since the last report.
+        if not force and is_report_fresh(path, fingerprint):
+            cached_tables.append(table_name)
+            continue
         # If the table is not too big.
         if table_name not in excluded_tables:
-            df = pd.read_sql_query(
-                f"SELECT * FROM {table_name}",
-                conn
-            )
+            if chunksize:
+                df = read_table(conn, table_name, chunksize)
+            else:
+                df = pd.read_sql_query(
+                    f"SELECT * FROM {table_name}",
+                    conn
+                )
             # If the table (dataframe) is not empty.
             if not df.empty:
                 profile = ProfileReport(df, minimal=True)
@@ -155,21 +177,17 @@ def create_reports(db_info, conn, excluded_tables, num_rows=100000) -> None:
                 # Save in the file because it is a more comfortable to
                 # explore data opening the reports in a browser rather
                 # than the notebook. Output in the notebook
-                profile.to_widgets()
+                if not headless:
+                    profile.to_widgets()
                 # Save the output in the html-files.
-                profile.to_file(f"reports/04/profile_report_{table_name}.html")
+                profile.to_file(path)
+                save_fingerprint(path, fingerprint)
             # If the table (dataframe) is empty.
             else:
                 empty_tables.append(table_name)
         # If the table is too big and inside a list of excluded_table.
         else:
-            df = pd.read_sql_query(
-                f"SELECT * "
-                f"FROM {table_name} "
-                f"ORDER BY RANDOM() "
-                f"LIMIT {num_rows}",
-                conn
-            )
+            df = sample_table(conn, table_name, num_rows, seed)
             # If the table (dataframe) is empty.
             if not df.empty:
                 profile = ProfileReport(df, minimal=True)
@@ -177,10 +195,11 @@ def create_reports(db_info, conn, excluded_tables, num_rows=100000) -> None:
                     f"Generating the profile report for table {table_name}..."
                 )
                 # Output in the notebook
-                profile.to_widgets()
+                if not headless:
+                    profile.to_widgets()
                 # Save the output in the html-files.
-                profile.to_file(
-                    f"reports/04/profile_report_{table_name}_{num_rows}_samples.html")
+                profile.to_file(path)
+                save_fingerprint(path, fingerprint)
             # If the table (dataframe) is empty.
             else:
                 empty_tables.append(table_name)
@@ -189,5 +208,30 @@ def create_reports(db_info, conn, excluded_tables, num_rows=100000) -> None:
         f"The profile reports have been generated.\n"
         f"The following tables have been excluded (several million lines take "
         f"a few hours to create the report):\n{excluded_tables}\n"
-        f"The empty dataframes for tables:\n{empty_tables}"
-    )
\ No newline at end of file
+        f"The empty dataframes for tables:\n{empty_tables}\n"
+        f"The unchanged tables (the reports are skipped):\n{cached_tables}"
+    )
+
+
+def create_reports_batch(db_info, database, excluded_tables, num_rows=100000,
+                         chunksize=None, seed=42, max_workers=None,
+                         force=False) -> pd.DataFrame:
+    """Creates reports using ydata_profiling in parallel.
+
+    The same reports as create_reports, but the tables are profiled by
+    a process pool and the widgets are not rendered. database is the
+    PostgreSQL conninfo string (a connection cannot be sent to the
+    workers). Returns a DataFrame with the wall time and memory of
+    every table (see profile_reports.create_reports_parallel).
+    """
+    return create_reports_parallel(
+        database,
+        list(db_info),
+        "reports/04",
+        excluded_tables,
+        num_rows,
+        chunksize,
+        seed,
+        max_workers,
+        force
+    )
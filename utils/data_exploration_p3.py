@@ -1,27 +1,113 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# The name suffixes that are dropped by normalize_names.
+NAME_SUFFIXES = r"\s+(?:jr|sr|ii|iii|iv|v)$"
+
+
 def compare_players(df1, df2, names):
     """Compares data for every table from two sources.
 
     The function prints a lists of players data from two sources. This
     data can be pasted and saved as a csv-file. It helps to find the
     same players.
+
+    The pairs of rows with the same name are found by one merge instead
+    of filtering both DFs for every pair. Nothing is returned, so the
+    notebook cell shows only the printed pairs; the split of the pairs
+    into the matched and ambiguous ones is made by match_players.
     """
-    player_list = []
-    manual_list = []
-    cnt_correct_rows = 0
-    cnt = 0
-    for name in names:#[1:40]:
-        rows_in_df1 = df1[df1["name"] == name].shape[0]
-        rows_in_df2 = df2[df2["name"] == name].shape[0]
+    df1 = df1[df1["name"].isin(names)].reset_index(drop=True)
+    df2 = df2[df2["name"].isin(names)].reset_index(drop=True)
+    pairs = pd.merge(
+        df1[["name"]].reset_index(),
+        df2[["name"]].reset_index(),
+        on="name"
+    )
+    rows1 = df1.to_numpy(dtype=object)[pairs["index_x"]]
+    rows2 = df2.to_numpy(dtype=object)[pairs["index_y"]]
+    rows = np.hstack([rows1, rows2]).tolist()
+    rows_by_name = {}
+    for name, res in zip(pairs["name"], rows):
+        rows_by_name.setdefault(name, []).append(res)
+    for name in names:
         print(name)
-        for row1 in range(rows_in_df1):
-            for row2 in range(rows_in_df2):
-                res = df1[df1["name"] == name].iloc[row1].tolist() + df2[df2["name"] == name].iloc[row2].tolist()
-                print(res)
-                if df1[df1["name"] == name].iloc[row1, 3] - df2[df2["name"] == name].iloc[row2, 3] == 0:
-                    res = df1[df1["name"] == name].iloc[row1].tolist() + df2[df2["name"] == name].iloc[row2].tolist()
-                    player_list.append(res)
-                    cnt_correct_rows += 1
-                    cnt += 1
-                else:
-                    res = df1[df1["name"] == name].iloc[row1].tolist() + df2[df2["name"] == name].iloc[row2].tolist()
-                    manual_list.append(res)
+        for res in rows_by_name.get(name, []):
+            print(res)
+
+
+def normalize_names(names: pd.Series) -> pd.Series:
+    """Normalises the player names for matching.
+
+    Drops the Hall of Fame mark "*", accents, punctuation and suffixes
+    (Jr., III, ...) and lowercases the names, so "Álex Abrines" and
+    "Alex Abrines", or "Gary Payton II" and "Gary Payton" have the same
+    key.
+    """
+    return (
+        names.astype(str)
+        .str.rstrip("*")
+        .str.normalize("NFKD")
+        .str.encode("ascii", errors="ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[.,'`]", "", regex=True)
+        .str.replace(r"[\s\-]+", " ", regex=True)
+        .str.strip()
+        .str.replace(NAME_SUFFIXES, "", regex=True)
+    )
+
+
+def match_players(df1, df2, id1="player_id", id2="person_id",
+                  tolerance=1, margin=0.1
+                  ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Matches the players from two sources by name and career years.
+
+    df1 and df2 have the id, name, from_year and to_year columns. The
+    candidates are the pairs with the same normalised name (see
+    normalize_names), found by one merge. Every candidate is scored by
+    the overlap of the careers divided by their total span (1 is the
+    same career). The overlap is extended by tolerance years, because
+    the sources count the years differently (the game dates and the
+    seasons).
+
+    Returns 3 DFs:
+        - matched: the best candidate of every df1 player that is
+          better than the others by margin,
+        - ambiguous: all candidates of the df1 players with several
+          close candidates,
+        - unmatched: the df1 players without candidates.
+    """
+    columns = ["name", "from_year", "to_year"]
+    left = df1[[id1] + columns].assign(key=normalize_names(df1["name"]))
+    right = df2[[id2] + columns].assign(key=normalize_names(df2["name"]))
+    candidates = pd.merge(left, right, on="key", suffixes=("", "_2"))
+    first = np.maximum(candidates["from_year"], candidates["from_year_2"])
+    last = np.minimum(candidates["to_year"], candidates["to_year_2"])
+    span = (
+        np.maximum(candidates["to_year"], candidates["to_year_2"])
+        - np.minimum(candidates["from_year"], candidates["from_year_2"])
+        + 1
+    )
+    overlap = (last - first + 1 + tolerance).clip(lower=0)
+    candidates["score"] = (overlap / span).clip(upper=1)
+    candidates = candidates[candidates["score"] > 0].sort_values(
+        [id1, "score"], ascending=[True, False], kind="stable"
+    )
+    # Compare the best candidate with the second best one.
+    rank = candidates.groupby(id1).cumcount()
+    best = candidates[id1].map(
+        candidates.loc[rank == 0].set_index(id1)["score"]
+    )
+    second = candidates[id1].map(
+        candidates.loc[rank == 1].set_index(id1)["score"]
+    )
+    is_clear = second.isna() | (best - second >= margin)
+    is_first = rank == 0
+    matched = candidates[is_first & is_clear].reset_index(drop=True)
+    ambiguous = candidates[~is_clear].reset_index(drop=True)
+    unmatched = df1[~df1[id1].isin(candidates[id1])].reset_index(drop=True)
+    return matched, ambiguous, unmatched
@@ -0,0 +1,219 @@
+# Import the bultin libraries.
+import logging
+import sys
+import time
+
+# Import the third-party libraries.
+import requests
+
+# Import the local/project packages, modules, and fucntions.
+from utils.data_collection import (
+    STATS_URL,
+    create_id_indexes,
+    fetch_stats_page,
+    forget_rows,
+    get_checkpoints,
+    insert_data,
+    log_id_indexes,
+    save_checkpoint,
+    split_stats_page
+)
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+class PipelineStats:
+    """Counts items and time of every stage of the pipeline.
+
+    The stages are "fetch" (pages), "transform" (rows) and "write"
+    (rows). The counters are updated by the stages and can be logged
+    at any time.
+    """
+
+    def __init__(self):
+        self.items = {"fetch": 0, "transform": 0, "write": 0}
+        self.seconds = {"fetch": 0.0, "transform": 0.0, "write": 0.0}
+
+    def add(self, stage, items, seconds):
+        """Adds the processed items and the time to the stage."""
+        self.items[stage] += items
+        self.seconds[stage] += seconds
+
+    def throughput(self, stage):
+        """Gets the items per second of the stage."""
+        seconds = self.seconds[stage]
+        return self.items[stage] / seconds if seconds else 0.0
+
+    def log(self):
+        """Logs the throughput of every stage."""
+        logger.info(
+            f"Fetch: {self.items['fetch']} pages "
+            f"({self.throughput('fetch'):.2f} pages/s), "
+            f"transform: {self.items['transform']} rows "
+            f"({self.throughput('transform'):.0f} rows/s), "
+            f"write: {self.items['write']} rows "
+            f"({self.throughput('write'):.0f} rows/s)."
+        )
+
+
+def row_bytes(row):
+    """Estimates memory of a row dict in bytes."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+
+
+def produce_pages(season, start_page=1, url=STATS_URL, limiter=None,
+                  session=None, stats=None):
+    """Yields (page, total_pages, data) for every page of the season."""
+    page = start_page
+    while True:
+        start = time.perf_counter()
+        data = fetch_stats_page(
+            url, season, page, limiter=limiter, session=session
+        )
+        if stats is not None:
+            stats.add("fetch", 1, time.perf_counter() - start)
+        total_pages = data["meta"]["total_pages"]
+        yield page, total_pages, data
+        if data["meta"]["current_page"] >= total_pages:
+            return
+        page += 1
+
+
+def transform_pages(pages, stats=None):
+    """Yields (page, total_pages, rows, nbytes) for every page.
+
+    rows is a tuple of lists for the games, players and stats tables
+    (see split_stats_page). The duplicate games and players are
+    dropped when their batch is written (see write_batches). nbytes
+    estimates memory of the rows.
+    """
+    for page, total_pages, data in pages:
+        start = time.perf_counter()
+        games, players, rows = split_stats_page(data)
+        nbytes = sum(
+            row_bytes(row) for table in (games, players, rows)
+            for row in table
+        )
+        if stats is not None:
+            stats.add("transform", len(rows), time.perf_counter() - start)
+        yield page, total_pages, (games, players, rows), nbytes
+
+
+def write_batches(cur, conn, season, pages, batch_rows=10000,
+                  batch_bytes=None, insert_method="copy", stats=None,
+                  optimized=False, seen=None):
+    """Inserts the transformed pages in batches and saves changes.
+
+    A batch is inserted when it has batch_rows stats rows or takes
+    batch_bytes of memory (if set), or on the last page. A batch always
+    ends on a page boundary, so it is saved with the checkpoint of the
+    season (see data_collection.save_checkpoint). If the API request
+    fails, the pages retrieved before the failure are saved. The
+    insert_method and optimized parameters are passed to
+    data_collection.insert_data.
+
+    The games and players already written are dropped by the seen dict
+    of IdIndex (see data_collection.create_id_indexes) when a batch is
+    inserted, and they are marked as seen only if the batch is saved.
+    """
+    seen = create_id_indexes() if seen is None else seen
+    buffers = ([], [], [])
+    first_page = None
+    nbytes_in_batch = 0
+
+    def flush(page, total_pages):
+        """Inserts the batch, the checkpoint and saves changes."""
+        nonlocal buffers, first_page, nbytes_in_batch
+        start = time.perf_counter()
+        games = seen["games"].filter_rows(buffers[0])
+        players = seen["players"].filter_rows(buffers[1])
+        try:
+            insert_data(
+                cur, (games, players, buffers[2]), insert_method, optimized
+            )
+            save_checkpoint(cur, season, page, total_pages)
+            conn.commit()
+        except Exception:
+            forget_rows(seen, games, players)
+            raise
+        if stats is not None:
+            stats.add("write", len(buffers[2]), time.perf_counter() - start)
+        logger.info(
+            f"The changes in the games, players and stats tables have "
+            f"been saved (Season {season}: {first_page}-{page} of "
+            f"{total_pages} pages, {len(buffers[2])} rows, "
+            f"~{nbytes_in_batch / 1024 ** 2:.1f} MB)."
+        )
+        buffers = ([], [], [])
+        first_page = None
+        nbytes_in_batch = 0
+
+    try:
+        for page, total_pages, rows, nbytes in pages:
+            first_page = page if first_page is None else first_page
+            for buffer, table_rows in zip(buffers, rows):
+                buffer.extend(table_rows)
+            nbytes_in_batch += nbytes
+            if (len(buffers[2]) >= batch_rows
+                    or (batch_bytes is not None
+                        and nbytes_in_batch >= batch_bytes)
+                    or page >= total_pages):
+                flush(page, total_pages)
+    except requests.RequestException:
+        if first_page is not None:
+            flush(page, total_pages)
+        raise
+
+
+def stream_data(cur, conn, seasons, url=STATS_URL, limiter=None,
+                session=None, batch_rows=10000, batch_bytes=None,
+                insert_method="copy", resume=False, seen=None,
+                optimized=False):
+    """Gets data over API and inserts it to the DB as a stream.
+
+    The pages of every season go through the generators
+    produce_pages -> transform_pages -> write_batches, so only one
+    batch is kept in memory regardless of the season size. The games
+    and players are de-duplicated for the whole run by the seen dict of
+    IdIndex, which can be warmed from the DB (see
+    data_collection.create_id_indexes). If resume is True, finished
+    seasons are skipped and the others start from the next uncommitted
+    page. Returns PipelineStats of the run.
+    """
+    stats = PipelineStats()
+    seen = create_id_indexes() if seen is None else seen
+    checkpoints = get_checkpoints(cur) if resume else {}
+    for season in seasons:
+        start_page = 1
+        if season in checkpoints:
+            last_page, total_pages = checkpoints[season]
+            if last_page >= total_pages:
+                logger.info(f"Season {season} has been already retrieved.")
+                continue
+            start_page = last_page + 1
+        pages = produce_pages(
+            season, start_page, url, limiter, session, stats
+        )
+        rows = transform_pages(pages, stats)
+        try:
+            write_batches(
+                cur, conn, season, rows, batch_rows, batch_bytes,
+                insert_method, stats, optimized, seen
+            )
+        except requests.RequestException as e:
+            logger.error(f"API requests failed: {e}.")
+            stats.log()
+            raise SystemExit("API request failed. Exiting program.")
+        stats.log()
+    log_id_indexes(seen)
+    return stats
@@ -0,0 +1,204 @@
+# Import the bultin libraries.
+import logging
+import multiprocessing
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def is_sqlite(conn):
+    """Checks if the connection is a SQLite (not PostgreSQL) one."""
+    return isinstance(conn, sqlite3.Connection)
+
+
+def connect(database):
+    """Opens a connection to the database.
+
+    database is a path to a SQLite file or a PostgreSQL conninfo string
+    ("postgresql://..." or "dbname=nba user=..."). Unlike connections,
+    the string can be sent to the worker processes.
+    """
+    if (database.startswith(("postgresql://", "postgres://"))
+            or "=" in database):
+        import psycopg
+        return psycopg.connect(database)
+    return sqlite3.connect(database)
+
+
+def downcast_chunk(df):
+    """Converts the numeric columns of the chunk to the smallest dtypes.
+
+    The integers are downcast to the smallest integer type and the
+    floats to float32. The text columns are kept, because categories
+    of separate chunks do not match.
+    """
+    for column in df.columns:
+        if pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+        elif pd.api.types.is_float_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast="float")
+    return df
+
+
+def read_table_chunks(conn, table_name, chunksize=100000, downcast=True):
+    """Yields the rows of the table as DataFrames of chunksize rows.
+
+    The rows are streamed from the DB, so only one chunk is kept in
+    memory: SQLite cursors fetch the rows lazily and PostgreSQL uses a
+    named (server-side) cursor. conn is a sqlite3 or psycopg
+    connection.
+    """
+    if is_sqlite(conn):
+        cur = conn.cursor()
+        cur.execute(f'SELECT * FROM "{table_name}"')
+    else:
+        from psycopg import sql
+        cur = conn.cursor(name=f"read_{table_name}")
+        cur.itersize = chunksize
+        cur.execute(
+            sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name))
+        )
+    try:
+        columns = [column[0] for column in cur.description]
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(
+                rows, columns=columns, coerce_float=True
+            )
+            yield downcast_chunk(df) if downcast else df
+    finally:
+        cur.close()
+
+
+def read_table(conn, table_name, chunksize=100000, downcast=True):
+    """Loads the table chunk by chunk.
+
+    Peak memory is the downcast result plus one raw chunk instead of
+    the whole raw table (see read_table_chunks).
+    """
+    chunks = list(read_table_chunks(conn, table_name, chunksize, downcast))
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks, ignore_index=True)
+    logger.debug(
+        f"The {table_name} table has been loaded: {len(df)} rows, "
+        f"{df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB."
+    )
+    return df
+
+
+def peak_rss_mb():
+    """Gets the peak resident set size of the process in MB.
+
+    Returns None if the resource module is not available (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def create_synthetic_table(path, table_name="synthetic", num_rows=2000000,
+                           seed=42):
+    """Creates a SQLite table that looks like play_by_play."""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f"""
+        CREATE TABLE "{table_name}" (
+               game_id INTEGER,
+               eventnum INTEGER,
+               period INTEGER,
+               score_margin REAL,
+               player_id INTEGER,
+               description TEXT
+        )
+    """)
+    batch = 100000
+    for start in range(0, num_rows, batch):
+        size = min(batch, num_rows - start)
+        rows = zip(
+            (rng.integers(20000000, 29999999, size)).tolist(),
+            (np.arange(start, start + size) % 500).tolist(),
+            rng.integers(1, 5, size).tolist(),
+            rng.normal(0, 10, size).tolist(),
+            rng.integers(1, 5000, size).tolist(),
+            rng.choice(["Jump Shot", "Layup", "Rebound", "Foul"], size)
+            .tolist()
+        )
+        conn.executemany(
+            f'INSERT INTO "{table_name}" VALUES (?, ?, ?, ?, ?, ?)', rows
+        )
+    conn.commit()
+    conn.close()
+    logger.info(f"{num_rows} rows have been inserted to {table_name}.")
+
+
+def load_in_child(path, table_name, mode, chunksize):
+    """Loads the table in the mode and gets the time and peak RSS."""
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    if mode == "read_sql_query":
+        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+        num_rows = len(df)
+    elif mode == "read_table":
+        df = read_table(conn, table_name, chunksize)
+        num_rows = len(df)
+    else:
+        num_rows = sum(
+            len(df) for df in read_table_chunks(conn, table_name, chunksize)
+        )
+    seconds = time.perf_counter() - start
+    conn.close()
+    return num_rows, seconds, peak_rss_mb()
+
+
+def benchmark_peak_rss(path, table_name="synthetic", chunksize=100000):
+    """Compares peak RSS of the full and chunked reads of the table.
+
+    The modes are:
+        - read_sql_query: pd.read_sql_query("SELECT * ..."),
+        - read_table: the chunks are downcast and concatenated,
+        - read_table_chunks: the chunks are only iterated.
+    Every mode runs in a new (spawned) process, so the peaks do not
+    affect each other. Returns a DataFrame with the rows, time and peak RSS.
+    """
+    results = []
+    for mode in ("read_sql_query", "read_table", "read_table_chunks"):
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            num_rows, seconds, peak = executor.submit(
+                load_in_child, path, table_name, mode, chunksize
+            ).result()
+        results.append({
+            "mode": mode,
+            "rows": num_rows,
+            "seconds": seconds,
+            "peak_rss_mb": peak
+        })
+    df = pd.DataFrame(results)
+    logger.info(f"The peak RSS benchmark:\n{df}")
+    return df
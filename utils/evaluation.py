@@ -0,0 +1,136 @@
+# Import the bultin libraries.
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The metrics of notebooks 06 and 07.
+METRICS = ["MAE", "MSE", "RMSE", "R2"]
+
+
+def compute_metrics(y_true, y_pred):
+    """Computes the metrics of every column of the 2D arrays at once.
+
+    The values are the same as mean_absolute_error, mean_squared_error,
+    its square root and r2_score of sklearn for every column. Returns a
+    dict with METRICS as the keys and arrays (one value per column).
+    """
+    errors = y_true - y_pred
+    mse = np.mean(errors ** 2, axis=0)
+    variance = np.mean((y_true - y_true.mean(axis=0)) ** 2, axis=0)
+    return {
+        "MAE": np.mean(np.abs(errors), axis=0),
+        "MSE": mse,
+        "RMSE": np.sqrt(mse),
+        "R2": 1 - mse / variance
+    }
+
+
+def evaluate_model(name, model, splits, scaler=None):
+    """Evaluates the fitted model on every split.
+
+    splits is a dict like {"train": (x_train, y_train), ...}. Every
+    split is predicted once, and the predict time is recorded. If the
+    target scaler is given (like pkls/scaler.pkl), the true and the
+    predicted values are inverse-transformed once and the metrics of
+    both scales are computed together (see compute_metrics). Returns a
+    list of dicts, one per split and scale.
+    """
+    rows = []
+    for split, (x, y) in splits.items():
+        start = time.perf_counter()
+        y_pred = model.predict(x)
+        seconds = time.perf_counter() - start
+        y_true = np.asarray(y, dtype=np.float64).reshape(-1, 1)
+        y_pred = np.asarray(y_pred, dtype=np.float64).reshape(-1, 1)
+        scales = ["scaled"]
+        if scaler is not None:
+            # The scaler has one column, so both columns are
+            # transformed by one call as a long column.
+            original = scaler.inverse_transform(
+                np.hstack([y_true, y_pred]).reshape(-1, 1)
+            ).reshape(-1, 2)
+            y_true = np.hstack([y_true, original[:, :1]])
+            y_pred = np.hstack([y_pred, original[:, 1:]])
+            scales.append("original")
+        metrics = compute_metrics(y_true, y_pred)
+        for i, scale in enumerate(scales):
+            rows.append({
+                "model": name,
+                "split": split,
+                "scale": scale,
+                **{metric: metrics[metric][i] for metric in METRICS},
+                "rows": len(y_true),
+                "predict_seconds": seconds,
+                "predict_us_per_row": seconds / len(y_true) * 1e6
+            })
+    return rows
+
+
+def evaluate_models(models, splits, scaler=None, max_workers=None):
+    """Evaluates the fitted models on the splits.
+
+    models is a dict with the model names as the keys (see
+    evaluate_model for splits and scaler). If max_workers is greater
+    than 1, the models are evaluated in a process pool; the predict
+    times are then measured in parallel and can be higher. Returns a
+    tidy DataFrame with a row per model, split and scale, the METRICS
+    columns and the predict time (see to_metrics_table).
+    """
+    if max_workers is None or max_workers <= 1:
+        results = [
+            evaluate_model(name, model, splits, scaler)
+            for name, model in models.items()
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(evaluate_model, name, model, splits, scaler)
+                for name, model in models.items()
+            ]
+            results = [future.result() for future in futures]
+    df = pd.DataFrame([row for rows in results for row in rows])
+    logger.info(f"{len(models)} models have been evaluated.")
+    return df
+
+
+def to_metrics_table(df, scale="original"):
+    """Converts the result of evaluate_models to the notebook layout.
+
+    Returns the DataFrame like df_metrics of notebooks 06 and 07: the
+    METRICS as the index and the (model, split) columns.
+    """
+    df = df[df["scale"] == scale]
+    table = df.set_index(["model", "split"])[METRICS].T
+    # Keep the order of the models and splits.
+    return table[pd.MultiIndex.from_frame(df[["model", "split"]])]
+
+
+def get_latency_table(df):
+    """Gets the predict time of every model on every split."""
+    return (
+        df.drop_duplicates(["model", "split"])
+        .pivot(index="model", columns="split", values="predict_us_per_row")
+        .reindex(index=df["model"].unique(), columns=df["split"].unique())
+    )
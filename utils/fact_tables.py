@@ -0,0 +1,200 @@
+# Import the bultin libraries.
+import logging
+import sys
+
+# Import the third-party libraries.
+import pandas as pd
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The stats columns copied to the fact table.
+STATS_COLUMNS = [
+    "ast", "blk", "dreb", "fg3_pct", "fg3a", "fg3m", "fg_pct", "fga", "fgm",
+    "ft_pct", "fta", "ftm", "oreb", "pf", "pts", "reb", "stl", "turnover"
+]
+
+
+def create_fact_tables(cur, optimized=False):
+    """Creates the fact tables in the nba database in PostgreSQL.
+
+    Creates the 3 tables:
+        - player_game_facts: the denormalised rows of the stats, games,
+          players and teams join (one row per box score),
+        - player_careers: the first and last year of every player,
+        - fact_refreshes: the log of refresh_fact_tables calls.
+    The tables are filled by refresh_fact_tables. If optimized is True,
+    the minutes are stored as seconds (min_seconds) like in the
+    optimized stats table (see data_collection.create_tables).
+    """
+    minutes = "min_seconds INTEGER" if optimized else "min TEXT"
+    stats_columns = ",\n".join(
+        f"               {column} NUMERIC" if column.endswith("_pct")
+        else f"               {column} INTEGER"
+        for column in STATS_COLUMNS
+    )
+    # Create the player_game_facts table.
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS player_game_facts (
+               stat_id      INTEGER PRIMARY KEY,
+               player_id    INTEGER,
+               first_name   TEXT,
+               last_name    TEXT,
+               abbreviation TEXT,
+               full_name    TEXT,
+               position     TEXT,
+               season       INTEGER,
+{stats_columns},
+               {minutes},
+               team_id      INTEGER,
+               game_id      INTEGER,
+               date         TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS player_game_facts_game_id_idx
+            ON player_game_facts (game_id)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS player_game_facts_season_idx
+            ON player_game_facts (season)
+    """)
+    # Create the player_careers table.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS player_careers (
+               player_id INTEGER PRIMARY KEY,
+               from_year INTEGER,
+               to_year   INTEGER
+        )
+    """)
+    # Create the fact_refreshes table.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS fact_refreshes (
+               refreshed_at TIMESTAMP PRIMARY KEY,
+               games        INTEGER,
+               rows         INTEGER
+        )
+    """)
+
+
+def refresh_fact_tables(cur, conn, since_date=None, optimized=False):
+    """Adds the new box scores to the fact tables.
+
+    The games processed are the games of the stats rows that are not in
+    player_game_facts yet (an anti-join on the stat id), so the box
+    scores added to a game that has already been refreshed are also
+    found, whatever their ids are. The games from since_date (if set)
+    are processed again, e.g. after data_collection.sync_data has
+    changed their box scores. The careers are updated only for the
+    players of these games. Returns a number of the refreshed rows.
+    """
+    minutes = "min_seconds" if optimized else "min"
+    # Find the games to process.
+    cur.execute("""
+        CREATE TEMP TABLE refresh_games ON COMMIT DROP AS
+        SELECT s.game_id AS id
+          FROM stats AS s
+         WHERE NOT EXISTS (
+               SELECT 1
+                 FROM player_game_facts AS f
+                WHERE f.stat_id = s.id)
+         UNION
+        SELECT g.id
+          FROM games AS g
+         WHERE g.date >= %(since_date)s
+    """, {"since_date": since_date})
+    cur.execute("SELECT COUNT(*) FROM refresh_games")
+    num_games = cur.fetchone()[0]
+    # Insert or update the denormalised rows of the games.
+    columns = STATS_COLUMNS + [minutes]
+    cur.execute(f"""
+        INSERT INTO player_game_facts (
+               stat_id, player_id, first_name, last_name, abbreviation,
+               full_name, position, season, {", ".join(columns)},
+               team_id, game_id, date
+        )
+        SELECT s.id,
+               s.player_id,
+               p.first_name,
+               p.last_name,
+               t.abbreviation,
+               t.full_name,
+               p.position,
+               g.season,
+               {", ".join(f"s.{column}" for column in columns)},
+               s.team_id,
+               s.game_id,
+               g.date
+          FROM stats AS s
+          JOIN refresh_games AS r
+            ON s.game_id = r.id
+          JOIN games AS g
+            ON s.game_id = g.id
+          JOIN players AS p
+            ON s.player_id = p.id
+          JOIN teams AS t
+            ON s.team_id = t.id
+        ON CONFLICT (stat_id) DO UPDATE
+           SET ({", ".join(columns)}) = ROW({", ".join(
+               f"EXCLUDED.{column}" for column in columns)})
+    """)
+    num_rows = cur.rowcount
+    # Extend the careers of the players of the processed games.
+    cur.execute("""
+        INSERT INTO player_careers (player_id, from_year, to_year)
+        SELECT f.player_id,
+               EXTRACT(YEAR FROM MIN(f.date)),
+               EXTRACT(YEAR FROM MAX(f.date))
+          FROM player_game_facts AS f
+          JOIN refresh_games AS r
+            ON f.game_id = r.id
+         GROUP BY f.player_id
+        ON CONFLICT (player_id) DO UPDATE
+           SET from_year = LEAST(player_careers.from_year,
+                                 EXCLUDED.from_year),
+               to_year = GREATEST(player_careers.to_year, EXCLUDED.to_year)
+    """)
+    cur.execute("""
+        INSERT INTO fact_refreshes (refreshed_at, games, rows)
+        VALUES (clock_timestamp(), %(games)s, %(rows)s)
+    """, {"games": num_games, "rows": num_rows})
+    conn.commit()
+    logger.info(
+        f"The fact tables have been refreshed: {num_games} games, "
+        f"{num_rows} rows."
+    )
+    return num_rows
+
+
+def load_player_games(con, first_season=1983, last_season=2023):
+    """Loads the player-game rows with the career bounds.
+
+    The result has the columns of the main query of notebook 05, but it
+    is read from the fact tables instead of the four-way join and the
+    player_career aggregate. con is a connection or SQLAlchemy engine.
+    """
+    query = """
+        SELECT f.*,
+               c.from_year,
+               c.to_year
+          FROM player_game_facts AS f
+          JOIN player_careers AS c
+            ON f.player_id = c.player_id
+         WHERE f.season BETWEEN %(first_season)s AND %(last_season)s
+    """
+    df = pd.read_sql_query(
+        query,
+        con,
+        params={"first_season": first_season, "last_season": last_season}
+    )
+    return df.drop(columns="stat_id")
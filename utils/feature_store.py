@@ -0,0 +1,309 @@
+# Import the bultin libraries.
+import json
+import logging
+import os
+import shutil
+import sys
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+# Import the local/project packages, modules, and fucntions.
+from utils.crosswalk import load_player_dataset
+from utils.parquet_store import load_parquet, save_parquet
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The stats summed for every player and season (notebook 06).
+SUM_COLUMNS = [
+    "pts", "reb", "ast", "blk", "fga", "fgm", "fta", "ftm", "turnover"
+]
+
+# The features and the target of the models of notebooks 06 and 07.
+FEATURE_COLUMNS = SUM_COLUMNS + ["age"]
+TARGET_COLUMN = "eff"
+
+# The dtypes of the stored features. They are the same for every
+# season, so the partitions saved separately have the same schema.
+FEATURE_DTYPES = {
+    "player_id": "int32", "season": "int16", **dict.fromkeys(
+        SUM_COLUMNS, "int32"
+    ), "age": "int16", "games": "int16", TARGET_COLUMN: "float64"
+}
+
+# The source columns that change the features of a season.
+SOURCE_COLUMNS = ["player_id", "season", "name", "date", "birth_date"]
+
+# The name of the file with the season fingerprints of a store.
+FINGERPRINTS_FILE = "_fingerprints.json"
+
+
+def prepare_player_games(df):
+    """Adds the age and eff columns to the player-game rows.
+
+    df is the result DataFrame of notebook 05 (or the result of
+    crosswalk.load_player_dataset). Like in notebook 06, the rows
+    without the birth date are dropped and the missing stats are 0.
+    """
+    df = df.dropna(subset=["birth_date"])
+    stats = df[SUM_COLUMNS].fillna(0).to_numpy(dtype=np.float64)
+    days = (df["date"] - df["birth_date"]).dt.days.to_numpy()
+    return df.assign(
+        **dict(zip(SUM_COLUMNS, stats.T)),
+        age=np.round(days / 365).astype(int),
+        eff=compute_eff(df)
+    )
+
+
+def compute_eff(df):
+    """Computes the eff of every row; the missing stats are 0.
+
+    The eff is pts + reb + ast + blk - missed FG - missed FT -
+    turnovers. Returns a numpy array.
+    """
+    stats = df[SUM_COLUMNS].fillna(0).to_numpy(dtype=np.float64)
+    pts, reb, ast, blk, fga, fgm, fta, ftm, turnover = stats.T
+    return pts + reb + ast + blk - (fga - fgm) - (fta - ftm) - turnover
+
+
+def aggregate_player_seasons(df):
+    """Aggregates the player-game rows by player and season.
+
+    This is df_grouped of notebook 06 (the sums of SUM_COLUMNS, the age
+    in the first game, the number of games and the mean eff), but the
+    rows are grouped by the integer player_id instead of the name, so
+    the players with the same name are not merged. The rows are sorted
+    once by the integer key player_id * 10000 + season, and every group
+    is a slice of the sorted arrays reduced by np.add.reduceat. The age
+    grows with the date, so the age in the first game is the minimum.
+    df is the result of prepare_player_games.
+    """
+    columns = ["player_id", "season", "name"] + SUM_COLUMNS + [
+        "age", "games", TARGET_COLUMN
+    ]
+    if df.empty:
+        return pd.DataFrame(columns=columns).astype(FEATURE_DTYPES)
+    keys = (
+        df["player_id"].to_numpy(dtype=np.int64) * 10000
+        + df["season"].to_numpy(dtype=np.int64)
+    )
+    order = np.argsort(keys)
+    keys = keys[order]
+    is_start = np.empty(len(keys), dtype=bool)
+    is_start[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    values = df[SUM_COLUMNS + [TARGET_COLUMN]].to_numpy(dtype=np.float64)
+    sums = np.add.reduceat(values[order], starts, axis=0)
+    games = np.diff(np.append(starts, len(keys)))
+    result = pd.DataFrame({
+        "player_id": keys[starts] // 10000,
+        "season": keys[starts] % 10000,
+        "name": df["name"].to_numpy()[order[starts]],
+        **dict(zip(SUM_COLUMNS, sums[:, :-1].astype(np.int64).T)),
+        "age": np.minimum.reduceat(
+            df["age"].to_numpy()[order], starts
+        ),
+        "games": games,
+        TARGET_COLUMN: sums[:, -1] / games
+    })
+    return result[columns].astype(FEATURE_DTYPES)
+
+
+def season_fingerprints(df):
+    """Gets a fingerprint of the source rows of every season.
+
+    The fingerprint is the number of rows and the sum of the row hashes
+    (pd.util.hash_pandas_object) of the stats and SOURCE_COLUMNS, so it
+    does not depend on the order of the rows. Returns a dict with the
+    season as the key (a str, like in JSON).
+    """
+    columns = [column for column in SOURCE_COLUMNS if column in df.columns]
+    hashes = pd.util.hash_pandas_object(
+        df[columns + SUM_COLUMNS], index=False
+    )
+    groups = hashes.groupby(df["season"].to_numpy())
+    # The sum of the hashes wraps around as uint64.
+    sums = groups.sum()
+    counts = groups.size()
+    return {
+        str(season): f"{counts[season]}:{int(sums[season]):016x}"
+        for season in counts.index
+    }
+
+
+def load_fingerprints(path):
+    """Loads the season fingerprints of the store (empty if missing)."""
+    try:
+        with open(os.path.join(path, FINGERPRINTS_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_fingerprints(path, fingerprints):
+    """Saves the season fingerprints of the store."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, FINGERPRINTS_FILE), "w") as f:
+        json.dump(fingerprints, f, indent=4, sort_keys=True)
+
+
+def get_changed_seasons(path, fingerprints, force=False):
+    """Compares the fingerprints with the ones saved in the store.
+
+    Returns the sorted list of the new and changed seasons (all seasons
+    if force is True) and the saved fingerprints of the unchanged
+    seasons. The fingerprints of the changed seasons are dropped from
+    the store before their partitions are touched, so a failed update
+    is repeated by the next call. The partitions of the seasons that
+    are no longer in fingerprints are removed.
+    """
+    saved = {} if force else load_fingerprints(path)
+    changed = sorted(
+        int(season) for season, fingerprint in fingerprints.items()
+        if saved.get(season) != fingerprint
+    )
+    removed = set(load_fingerprints(path)) - set(fingerprints)
+    valid = {
+        season: fingerprint for season, fingerprint in saved.items()
+        if season in fingerprints and int(season) not in changed
+    }
+    save_fingerprints(path, valid)
+    for season in removed:
+        shutil.rmtree(
+            os.path.join(path, f"season={season}"), ignore_errors=True
+        )
+    return changed, valid
+
+
+def save_seasons(path, features, seasons, fingerprints, saved):
+    """Saves the features of the seasons and records their fingerprints.
+
+    The partitions of the saved seasons are replaced by save_parquet;
+    the partitions of the seasons without features are removed. saved
+    (the fingerprints in the store) is updated.
+    """
+    for season in set(seasons) - set(features["season"].unique()):
+        shutil.rmtree(
+            os.path.join(path, f"season={season}"), ignore_errors=True
+        )
+    if not features.empty:
+        save_parquet(features, path, optimize=False)
+    saved.update(
+        (str(season), fingerprints[str(season)]) for season in seasons
+    )
+    save_fingerprints(path, saved)
+
+
+def update_player_seasons(df, path="parquet/player_seasons", force=False):
+    """Updates the stored player-season features of the changed seasons.
+
+    df has the player-game rows of notebook 05 (see
+    prepare_player_games). The features are saved as Parquet files
+    partitioned by season (see parquet_store.save_parquet) with the
+    fingerprints of the source rows (see season_fingerprints). Only the
+    new seasons and the seasons with another fingerprint are
+    aggregated and rewritten; the seasons missing in df are removed.
+    Set force to rebuild all seasons. Returns the list of the updated
+    seasons.
+    """
+    fingerprints = season_fingerprints(df)
+    changed, saved = get_changed_seasons(path, fingerprints, force)
+    rows = df[df["season"].isin(changed)]
+    features = aggregate_player_seasons(prepare_player_games(rows))
+    save_seasons(path, features, changed, fingerprints, saved)
+    logger.info(
+        f"The player seasons have been updated: {len(changed)} of "
+        f"{len(fingerprints)} seasons."
+    )
+    return changed
+
+
+def refresh_player_seasons(con, path="parquet/player_seasons",
+                           first_season=1983, last_season=2023,
+                           min_confidence=0.0, force=False):
+    """Updates the stored features from the fact tables.
+
+    The fingerprint of every season (the number of rows and the sum of
+    the row hashes) is computed by PostgreSQL over the same join as
+    crosswalk.load_player_dataset, so only the rows of the changed
+    seasons are loaded and aggregated. Returns the list of the updated
+    seasons.
+    """
+    query = """
+        SELECT f.season,
+               COUNT(*) || ':' || SUM(hashtext(ROW(
+                   f.player_id, f.date, i.name, i.birth_date,
+                   f.pts, f.reb, f.ast, f.blk, f.fga, f.fgm, f.fta,
+                   f.ftm, f.turnover
+               )::TEXT)::BIGINT) AS fingerprint
+          FROM player_game_facts AS f
+          JOIN player_careers AS c
+            ON f.player_id = c.player_id
+          LEFT JOIN player_crosswalk AS x
+            ON f.player_id = x.player_id
+           AND x.confidence >= %(min_confidence)s
+          LEFT JOIN player_info AS i
+            ON x.person_id = i.person_id
+         WHERE f.season BETWEEN %(first_season)s AND %(last_season)s
+         GROUP BY f.season
+    """
+    fingerprints = dict(pd.read_sql_query(
+        query,
+        con,
+        params={
+            "first_season": first_season,
+            "last_season": last_season,
+            "min_confidence": min_confidence
+        }
+    ).astype({"season": str}).itertuples(index=False, name=None))
+    changed, saved = get_changed_seasons(path, fingerprints, force)
+    for season in changed:
+        df = load_player_dataset(con, season, season, min_confidence)
+        df["date"] = pd.to_datetime(df["date"])
+        features = aggregate_player_seasons(prepare_player_games(df))
+        save_seasons(path, features, [season], fingerprints, saved)
+    logger.info(
+        f"The player seasons have been refreshed: {len(changed)} of "
+        f"{len(fingerprints)} seasons."
+    )
+    return changed
+
+
+def load_player_seasons(path="parquet/player_seasons", seasons=None):
+    """Loads the stored player-season features sorted by player."""
+    df = load_parquet(path, seasons=seasons)
+    df["season"] = df["season"].astype(int)
+    return df.sort_values(["player_id", "season"], ignore_index=True)
+
+
+def scale_features(df, features=FEATURE_COLUMNS, target=TARGET_COLUMN):
+    """Adds the scaled features and target like notebook 06.
+
+    Returns the DataFrame with the *_scaled columns, the features
+    scaler and the target scaler (notebook 07 needs the target scaler
+    for the inverse transform; see pkls/scaler.pkl).
+    """
+    x_scaler = StandardScaler()
+    y_scaler = StandardScaler()
+    x_scaled = x_scaler.fit_transform(df[features])
+    y_scaled = y_scaler.fit_transform(df[[target]])
+    df = df.assign(**{
+        f"{column}_scaled": x_scaled[:, i]
+        for i, column in enumerate(features)
+    })
+    df[f"{target}_scaled"] = y_scaled[:, 0]
+    return df, x_scaler, y_scaler
@@ -0,0 +1,514 @@
+# Import the bultin libraries.
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+# Import the local/project packages, modules, and fucntions.
+from utils.box_scores import parse_minutes_series
+from utils.feature_store import SUM_COLUMNS, compute_eff
+from utils.parquet_store import load_parquet
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The integer values of a game that the features are computed from.
+VALUE_COLUMNS = [
+    "pts", "eff", "min_seconds", "fgm", "fga", "fg3m", "fg3a", "ftm", "fta"
+]
+
+# The features that are the means of a value (min is in minutes).
+MEAN_FEATURES = {"pts": "pts", "eff": "eff", "min": "min_seconds"}
+
+# The shooting percentages: the made shots divided by the attempts in
+# the window (not the mean of the percentages of the games).
+PCT_FEATURES = {
+    "fg_pct": ("fgm", "fga"),
+    "fg3_pct": ("fg3m", "fg3a"),
+    "ft_pct": ("ftm", "fta")
+}
+
+# The default windows (number of games) and the spans of the
+# exponentially weighted averages (alpha = 2 / (span + 1)).
+WINDOWS = (5, 10, 20)
+SPANS = (5, 20)
+
+# The key columns of the feature rows.
+KEY_COLUMNS = ["player_id", "game_id", "season", "date"]
+
+
+def prepare_game_values(df):
+    """Gets the values of every player game sorted by player and date.
+
+    df has the KEY_COLUMNS, the stats columns and min (text) or
+    min_seconds, like the player_game_facts table (see fact_tables).
+    The missing stats are 0. Returns a DataFrame with the KEY_COLUMNS
+    and the VALUE_COLUMNS (int64).
+    """
+    if "min_seconds" in df.columns:
+        seconds = df["min_seconds"].fillna(0).to_numpy(dtype=np.int64)
+    else:
+        seconds = parse_minutes_series(df["min"]).astype(np.int64)
+    stats = df[SUM_COLUMNS + ["fg3m", "fg3a"]].fillna(0)
+    values = pd.DataFrame({
+        **{column: df[column].to_numpy() for column in KEY_COLUMNS},
+        **{
+            column: stats[column].to_numpy(dtype=np.int64)
+            for column in VALUE_COLUMNS
+            if column in stats.columns
+        },
+        "eff": compute_eff(df).astype(np.int64),
+        "min_seconds": np.maximum(seconds, 0)
+    })
+    order = np.lexsort((
+        values["game_id"].to_numpy(),
+        values["date"].to_numpy(),
+        values["player_id"].to_numpy()
+    ))
+    return values.iloc[order].reset_index(drop=True)[
+        KEY_COLUMNS + VALUE_COLUMNS
+    ]
+
+
+def get_feature_columns(windows=WINDOWS, spans=SPANS):
+    """Gets the names of the features, e.g. pts_mean5 or fg_pct_ewm20."""
+    names = list(MEAN_FEATURES) + list(PCT_FEATURES)
+    return [
+        f"{name}_mean{window}" for window in windows for name in names
+    ] + [f"{name}_ewm{span}" for span in spans for name in names]
+
+
+def get_groups(player_ids):
+    """Gets the first row of every player and of the group of every row.
+
+    player_ids is sorted, so the games of a player are a slice.
+    """
+    is_start = np.empty(len(player_ids), dtype=bool)
+    is_start[:1] = True
+    np.not_equal(player_ids[1:], player_ids[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    sizes = np.diff(np.append(starts, len(player_ids)))
+    return starts, np.repeat(starts, sizes)
+
+
+def window_features(sums, counts, prefix, suffix, features):
+    """Converts the sums of the values in windows to the features."""
+    columns = {column: i for i, column in enumerate(VALUE_COLUMNS)}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name, column in MEAN_FEATURES.items():
+            mean = sums[:, columns[column]] / counts
+            if column == "min_seconds":
+                mean = mean / 60
+            features[f"{name}_{prefix}{suffix}"] = mean.astype(np.float32)
+        for name, (made, attempts) in PCT_FEATURES.items():
+            attempts = sums[:, columns[attempts]]
+            # The weighted sums of ewm_features have rounding errors
+            # instead of zeros, so the tiny attempts are no attempts.
+            pct = np.where(
+                attempts > 1e-6 * counts,
+                sums[:, columns[made]] / attempts,
+                np.nan
+            )
+            features[f"{name}_{prefix}{suffix}"] = pct.astype(np.float32)
+
+
+def rolling_features(values, group_starts, windows, shift, features):
+    """Adds the means of the values in the last games of the player.
+
+    The sum of a window is a difference of two cumulative sums, so all
+    windows of all players are computed without loops. The windows do
+    not cross the first game of the player (group_starts), and they
+    have fewer games at the beginning of the career. If shift is True,
+    the window ends with the previous game, so the features of a game
+    do not use its own stats.
+    """
+    cumsums = np.zeros((len(values) + 1, values.shape[1]), dtype=np.int64)
+    np.cumsum(values, axis=0, out=cumsums[1:])
+    stops = np.arange(len(values)) + (0 if shift else 1)
+    for window in windows:
+        starts = np.maximum(stops - window, group_starts)
+        counts = stops - starts
+        sums = cumsums[stops] - cumsums[starts]
+        # The first game has no previous games if shift is True.
+        counts = np.where(counts > 0, counts, np.nan)
+        window_features(sums, counts, "mean", window, features)
+
+
+def ewm_features(values, starts, group_starts, spans, shift, carry,
+                 features):
+    """Adds the exponentially weighted averages of the values.
+
+    The average is S / W (like pandas ewm with adjust=True), where
+    S = x + d * S_previous and W = 1 + d * W_previous, d = 1 - alpha.
+    S of all rows is computed by one IIR filter (lfilter) over all
+    players, and the part carried over from the previous player,
+    d ** (position + 1) * S_end_of_previous_player, is subtracted. The
+    state of the players at the beginning (S and W of the games before
+    values, see compute_game_windows) is carried in the same way.
+    Returns the dict of S and W at the last game of every player.
+    """
+    positions = np.arange(len(values)) - group_starts
+    values = values.astype(np.float64)
+    has_previous = (group_starts > 0)[:, np.newaxis]
+    ends = {}
+    for span in spans:
+        decay = 1 - 2 / (span + 1)
+        factors = (decay ** (positions + 1))[:, np.newaxis]
+        s = lfilter([1.0], [1.0, -decay], values, axis=0)
+        s -= factors * np.where(
+            has_previous, s[np.maximum(group_starts - 1, 0)], 0
+        )
+        s_start, w_start = carry(span)
+        s += factors * s_start[np.searchsorted(starts, group_starts)]
+        w = (
+            factors[:, 0] * w_start[np.searchsorted(starts, group_starts)]
+            + (1 - factors[:, 0]) / (1 - decay)
+        )
+        ends[span] = (s[np.append(starts[1:], len(values)) - 1],
+                      w[np.append(starts[1:], len(values)) - 1])
+        if shift:
+            # The average before the game: the previous row or the
+            # carried state at the first game of the player.
+            s = np.concatenate([s[:1], s[:-1]])
+            w = np.concatenate([w[:1], w[:-1]])
+            s[starts] = s_start
+            w[starts] = w_start
+        window_features(s, np.where(w > 0, w, np.nan), "ewm", span,
+                        features)
+    return ends
+
+
+def compute_game_windows(df, windows=WINDOWS, spans=SPANS, shift=True,
+                         state=None):
+    """Computes the game-window features of every player game.
+
+    The features are the means in the last games (windows) and the
+    exponentially weighted averages (spans) of pts, eff and min, and
+    the shooting percentages in the same windows (see get_feature
+    columns). The rows are sorted by player and date once (see
+    prepare_game_values), and all players are computed together by
+    vectorized operations (see rolling_features and ewm_features). If
+    shift is True, the features of a game use only the previous games.
+
+    state is the result of a previous call for the earlier games of
+    the players (None for the first call). df has only the new games,
+    and the windows are continued from the state: it keeps the last
+    max(windows) games and the weighted sums of every player.
+
+    Returns the DataFrame of the features (KEY_COLUMNS and float32
+    features) and the new state.
+    """
+    new_values = prepare_game_values(df)
+    history = None
+    if state is not None:
+        history = state["tail"][
+            state["tail"]["player_id"].isin(new_values["player_id"])
+        ]
+    values = pd.concat(
+        [history, new_values], ignore_index=True
+    ) if history is not None and len(history) else new_values
+    is_new = np.ones(len(values), dtype=bool)
+    is_new[:len(values) - len(new_values)] = False
+    # The history of a player is before the new games (the sort is
+    # stable, so both stay sorted by date).
+    order = np.lexsort((is_new, values["player_id"].to_numpy()))
+    values = values.iloc[order].reset_index(drop=True)
+    is_new = is_new[order]
+    player_ids = values["player_id"].to_numpy()
+    array = values[VALUE_COLUMNS].to_numpy(dtype=np.int64)
+    starts, group_starts = get_groups(player_ids)
+
+    # Compute the rolling means over the history and the new games.
+    rolling = {}
+    rolling_features(array, group_starts, windows, shift, rolling)
+    features = values.loc[is_new, KEY_COLUMNS].reset_index(drop=True)
+    for column, feature in rolling.items():
+        features[column] = feature[is_new]
+
+    # Compute the weighted averages over the new games from the state.
+    new_ids = player_ids[is_new]
+    new_starts, new_group_starts = get_groups(new_ids)
+    first_ids = new_ids[new_starts]
+
+    def carry(span):
+        if state is None:
+            zeros = np.zeros(len(first_ids))
+            return np.zeros((len(first_ids), len(VALUE_COLUMNS))), zeros
+        ewm = state["ewm"].reindex(first_ids)
+        s = ewm[[f"{column}_s{span}" for column in VALUE_COLUMNS]]
+        w = ewm[f"w{span}"]
+        return s.fillna(0).to_numpy(), w.fillna(0).to_numpy()
+
+    ewm = {}
+    ends = ewm_features(
+        array[is_new], new_starts, new_group_starts, spans, shift, carry,
+        ewm
+    )
+    for column, feature in ewm.items():
+        features[column] = feature
+
+    # Keep the last games and the weighted sums of every player.
+    sizes = np.diff(np.append(starts, len(values)))
+    positions = np.arange(len(values)) - group_starts
+    is_tail = positions >= np.repeat(sizes, sizes) - max(windows)
+    tail = values[is_tail].reset_index(drop=True)
+    ewm_state = pd.DataFrame(index=pd.Index(first_ids, name="player_id"))
+    for span, (s, w) in ends.items():
+        for i, column in enumerate(VALUE_COLUMNS):
+            ewm_state[f"{column}_s{span}"] = s[:, i]
+        ewm_state[f"w{span}"] = w
+    if state is not None:
+        tail = pd.concat([
+            state["tail"][~state["tail"]["player_id"].isin(first_ids)],
+            tail
+        ], ignore_index=True)
+        ewm_state = pd.concat([
+            state["ewm"][~state["ewm"].index.isin(first_ids)], ewm_state
+        ])
+    return features, {"tail": tail, "ewm": ewm_state}
+
+
+def estimate_row_bytes(windows=WINDOWS, spans=SPANS):
+    """Estimates the peak memory of compute_game_windows per game row.
+
+    The estimate is the loaded row and the temporary arrays of every
+    feature (about 1 KB with the default windows, measured by
+    tracemalloc).
+    """
+    return 300 + 24 * len(get_feature_columns(windows, spans))
+
+
+def get_player_batches(cur, since=None, rows_per_batch=1000000):
+    """Splits the players with new games into batches of rows.
+
+    Every batch is a range of player_id with about rows_per_batch new
+    games (the games since the date, all if None); a player with more
+    games is a batch alone. Returns a list of (first_id, last_id).
+    """
+    condition = "" if since is None else "WHERE date >= %s"
+    cur.execute(f"""
+        SELECT player_id, COUNT(*)
+          FROM player_game_facts
+          {condition}
+         GROUP BY player_id
+         ORDER BY player_id
+    """, () if since is None else (since,))
+    batches = []
+    rows = 0
+    for player_id, count in cur.fetchall():
+        if batches and rows + count <= rows_per_batch:
+            batches[-1][1] = player_id
+            rows += count
+        else:
+            batches.append([player_id, player_id])
+            rows = count
+    return [tuple(batch) for batch in batches]
+
+
+def get_minutes_column(cur):
+    """Gets min_seconds if the fact table has it (optimized), else min."""
+    cur.execute("""
+        SELECT 1
+          FROM information_schema.columns
+         WHERE table_schema = 'public'
+           AND table_name = 'player_game_facts'
+           AND column_name = 'min_seconds'
+    """)
+    return "min_seconds" if cur.fetchone() else "min"
+
+
+def drop_stored_games(df, state):
+    """Drops the games that are already in the state.
+
+    The games of the last stored date are loaded again (a game can be
+    added later for that date), and the stored ones are in the tail of
+    their player, since it is the last date.
+    """
+    if state is None:
+        return df
+    stored = pd.MultiIndex.from_frame(state["tail"][["player_id", "game_id"]])
+    keys = pd.MultiIndex.from_frame(df[["player_id", "game_id"]])
+    return df[~keys.isin(stored)]
+
+
+def remove_parts(path, update):
+    """Removes the feature parts of the update and the later ones.
+
+    They are left by a failed refresh, which did not save the meta.
+    """
+    directory = os.path.join(path, "features")
+    for name in os.listdir(directory):
+        if name.startswith("part-") and int(name[5:9]) >= update:
+            os.remove(os.path.join(directory, name))
+
+
+def load_meta(path):
+    """Loads the settings and the last date of the stored features."""
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_state(path, update):
+    """Loads the state saved by the update of refresh_game_windows."""
+    return {
+        name: pd.read_parquet(
+            os.path.join(path, "state", f"{name}-{update:04d}.parquet")
+        )
+        for name in ("tail", "ewm")
+    }
+
+
+def save_state(path, state, meta, update):
+    """Saves the state of the update and the meta of the stored features.
+
+    The state files are named by the update, and the meta is replaced
+    last (os.replace is atomic), so the update is committed by the
+    meta. The state of the other updates is removed after that.
+    """
+    directory = os.path.join(path, "state")
+    os.makedirs(directory, exist_ok=True)
+    names = {f"{name}-{update:04d}.parquet" for name in ("tail", "ewm")}
+    for name in ("tail", "ewm"):
+        state[name].to_parquet(
+            os.path.join(directory, f"{name}-{update:04d}.parquet")
+        )
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=4)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+    for name in os.listdir(directory):
+        if name not in names:
+            os.remove(os.path.join(directory, name))
+
+
+def refresh_game_windows(con, path="parquet/game_windows", windows=WINDOWS,
+                         spans=SPANS, memory_mb=512, force=False):
+    """Computes the game-window features of the player_game_facts table.
+
+    The first call computes the features of all games, and the next
+    calls only of the new games since the last stored date (the stored
+    games of that date are dropped, see drop_stored_games), continuing
+    the windows from the saved state (see compute_game_windows). The
+    games are loaded and computed in batches of players that fit in
+    memory_mb (see estimate_row_bytes), and every batch is added to
+    path/features as a Parquet file, so the whole 1983-2023 history
+    does not have to be in memory. The files are named by the update
+    and the batch, and the update is committed by save_state, so the
+    files of a failed update are removed by the next call. The
+    features are rebuilt if force is True or the windows or spans have
+    changed.
+    Returns the number of the new feature rows.
+    """
+    start = time.perf_counter()
+    meta = load_meta(path)
+    settings = {"windows": list(windows), "spans": list(spans)}
+    state = None
+    if not (force or meta is None
+            or {key: meta[key] for key in settings} != settings):
+        try:
+            state = load_state(path, meta["updates"] - 1)
+        except FileNotFoundError:
+            logger.warning(f"The state in {path} is missing, rebuilding.")
+    if state is None:
+        shutil.rmtree(path, ignore_errors=True)
+        meta = {**settings, "max_date": None, "updates": 0}
+    update = meta["updates"]
+    cur = con.cursor()
+    stats = ", ".join(SUM_COLUMNS + ["fg3m", "fg3a", get_minutes_column(cur)])
+    since = meta["max_date"]
+    rows_per_batch = memory_mb * 1024 ** 2 // estimate_row_bytes(
+        windows, spans
+    )
+    batches = get_player_batches(cur, since, rows_per_batch)
+    os.makedirs(os.path.join(path, "features"), exist_ok=True)
+    remove_parts(path, update)
+    tails = []
+    ewms = []
+    updated_ids = []
+    rows = 0
+    for i, (first_id, last_id) in enumerate(batches):
+        df = pd.read_sql_query(
+            f"""
+            SELECT player_id, game_id, season, date, {stats}
+              FROM player_game_facts
+             WHERE player_id BETWEEN %(first_id)s AND %(last_id)s
+               {"" if since is None else "AND date >= %(since)s"}
+            """,
+            con,
+            params={"first_id": first_id, "last_id": last_id,
+                    "since": since},
+            parse_dates=["date"]
+        )
+        df = drop_stored_games(df, state)
+        if df.empty:
+            continue
+        batch_state = None
+        if state is not None:
+            batch_state = {
+                "tail": state["tail"][
+                    state["tail"]["player_id"].isin(df["player_id"])
+                ],
+                "ewm": state["ewm"][
+                    state["ewm"].index.isin(df["player_id"])
+                ]
+            }
+        features, batch_state = compute_game_windows(
+            df, windows, spans, state=batch_state
+        )
+        features.to_parquet(os.path.join(
+            path, "features", f"part-{update:04d}-{i:05d}.parquet"
+        ), index=False)
+        tails.append(batch_state["tail"])
+        ewms.append(batch_state["ewm"])
+        updated_ids.append(df["player_id"].unique())
+        rows += len(features)
+        max_date = features["date"].max().isoformat()
+        meta["max_date"] = max(meta["max_date"] or max_date, max_date)
+    if state is not None and tails:
+        updated_ids = np.concatenate(updated_ids)
+        tails.insert(0, state["tail"][
+            ~state["tail"]["player_id"].isin(updated_ids)
+        ])
+        ewms.insert(0, state["ewm"][~state["ewm"].index.isin(updated_ids)])
+    if tails:
+        meta["updates"] = update + 1
+        save_state(
+            path,
+            {"tail": pd.concat(tails, ignore_index=True),
+             "ewm": pd.concat(ewms)},
+            meta,
+            update
+        )
+    logger.info(
+        f"The game windows have been refreshed: {rows} games in "
+        f"{len(batches)} batches, {time.perf_counter() - start:.1f} s."
+    )
+    return rows
+
+
+def load_game_windows(path="parquet/game_windows", columns=None,
+                      seasons=None):
+    """Loads the stored game-window features (see refresh_game_windows)."""
+    return load_parquet(
+        os.path.join(path, "features"), columns=columns, seasons=seasons
+    )
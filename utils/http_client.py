@@ -0,0 +1,243 @@
+# Import the bultin libraries.
+import gzip
+import hashlib
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+# Import the third-party libraries.
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The statuses that are retried with backoff.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CachedSession:
+    """Sends GET requests for the collectors.
+
+    The session:
+        - keeps the connections alive in a pool,
+        - retries the requests with exponential backoff and jitter on
+          429/5xx statuses and connection errors,
+        - caches the successful responses on disk.
+    The cache file is the gzip-compressed content named by the hash of
+    the URL and params. The files older than ttl seconds are expired,
+    and the least recently used files are removed if the cache is
+    larger than max_cache_bytes. The cache size is tracked by a running
+    total (the directory is listed once, then only by the eviction),
+    and the eviction reduces the cache to 90% of max_cache_bytes, so it
+    runs once per many saves. The hit/miss and bytes-saved counters
+    are in the stats dict.
+    """
+
+    def __init__(self, cache_dir=".cache/http", ttl=24 * 3600,
+                 max_cache_bytes=512 * 1024 ** 2, max_retries=5,
+                 backoff=1.0, max_backoff=60.0, pool_size=10, timeout=30):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_cache_bytes = max_cache_bytes
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "retries": 0}
+        self.lock = threading.Lock()
+        # The total size of the cache files (see cache_size).
+        self.cache_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_path(self, url, params=None):
+        """Gets the cache file path for the URL and params."""
+        query = urlencode(sorted((params or {}).items()), doseq=True)
+        key = hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.gz")
+
+    def is_cached(self, url, params=None):
+        """Checks if there is a fresh cached response."""
+        path = self.cache_path(url, params)
+        try:
+            return time.time() - os.path.getmtime(path) < self.ttl
+        except OSError:
+            return False
+
+    def get(self, url, params=None, use_cache=True):
+        """Sends a GET request or replays it from the cache.
+
+        Returns requests.Response. The response of the last attempt is
+        returned if all retries fail, so the caller can check its
+        status.
+        """
+        path = self.cache_path(url, params)
+        if use_cache and self.is_cached(url, params):
+            try:
+                with open(path, "rb") as f:
+                    compressed = f.read()
+                content = gzip.decompress(compressed)
+            except (OSError, EOFError) as e:
+                logger.warning(f"Broken cache file {path}: {e}.")
+            else:
+                # Update the access time used by the eviction. The TTL
+                # uses the modification time. The file can be evicted
+                # by another thread meanwhile (the content is read).
+                try:
+                    os.utime(path, (time.time(), os.path.getmtime(path)))
+                except OSError:
+                    pass
+                with self.lock:
+                    self.stats["hits"] += 1
+                    self.stats["bytes_saved"] += len(content)
+                logger.debug(f"Cache hit: {url} {params}.")
+                return self.build_response(url, content)
+        response = self.send(url, params)
+        with self.lock:
+            self.stats["misses"] += 1
+        if use_cache and response.status_code == 200:
+            self.save(path, response.content)
+        return response
+
+    def send(self, url, params=None):
+        """Sends a GET request with retries."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(
+                    url, params=params, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Request to {url} failed: {e}.")
+                delay = None
+            else:
+                if (response.status_code not in RETRY_STATUSES
+                        or attempt == self.max_retries):
+                    return response
+                logger.warning(
+                    f"Request to {url} returned {response.status_code}."
+                )
+                delay = response.headers.get("Retry-After")
+            # Use Retry-After if it is set in seconds, otherwise the
+            # exponential backoff with full jitter.
+            if delay is not None and delay.isdigit():
+                delay = int(delay)
+            else:
+                delay = random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2 ** attempt)
+                )
+            with self.lock:
+                self.stats["retries"] += 1
+            logger.info(f"Retry {attempt + 1} in {delay:.1f} s ...")
+            time.sleep(delay)
+
+    def save(self, path, content):
+        """Saves the content in the cache and evicts old files."""
+        compressed = gzip.compress(content)
+        # Write to a temporary file first, so parallel readers never
+        # see a partial file.
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        with self.lock:
+            total = self.cache_size()
+            try:
+                total -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+            self.cache_bytes = total + len(compressed)
+        if self.cache_bytes > self.max_cache_bytes:
+            self.evict()
+
+    def cache_size(self):
+        """Gets the running total of the cache size.
+
+        The cache directory is listed on the first call only; the
+        total is then updated by save and evict. Call it with the lock.
+        """
+        if self.cache_bytes is None:
+            self.cache_bytes = sum(
+                entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                if entry.name.endswith(".gz")
+            )
+        return self.cache_bytes
+
+    def evict(self):
+        """Removes the least recently used files over max_cache_bytes.
+
+        The files are removed until the cache is 90% of max_cache_bytes.
+        The total is recounted from the listed files, so it also covers
+        the files changed by other sessions.
+        """
+        with self.lock:
+            files = [
+                entry for entry in os.scandir(self.cache_dir)
+                if entry.name.endswith(".gz")
+            ]
+            stats = [(entry.path, entry.stat()) for entry in files]
+            total = sum(stat.st_size for _, stat in stats)
+            if total > self.max_cache_bytes:
+                target = 0.9 * self.max_cache_bytes
+                for path, stat in sorted(stats, key=lambda x: x[1].st_atime):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= stat.st_size
+                    if total <= target:
+                        break
+                logger.debug(f"The cache has been reduced to {total} bytes.")
+            self.cache_bytes = total
+
+    @staticmethod
+    def build_response(url, content):
+        """Creates requests.Response from the cached content."""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = content
+        response.encoding = "utf-8"
+        return response
+
+    def log_stats(self):
+        """Logs the cache and retry counters."""
+        logger.info(
+            f"Cache hits: {self.stats['hits']}, misses: "
+            f"{self.stats['misses']}, bytes saved: "
+            f"{self.stats['bytes_saved']}, retries: {self.stats['retries']}."
+        )
+
+
+# The session shared by the collectors.
+default_session = None
+default_session_lock = threading.Lock()
+
+
+def get_session():
+    """Gets the session shared by the collectors, creates it once."""
+    global default_session
+    with default_session_lock:
+        if default_session is None:
+            default_session = CachedSession()
+    return default_session
@@ -0,0 +1,356 @@
+# Import the bultin libraries.
+import logging
+import math
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import KFold, ParameterSampler
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The data of the process that fits the models (see init_worker).
+worker_data = {}
+
+
+class Budget:
+    """Tracks the time and the fits used by a search.
+
+    A fit on a fraction of the resource (see search) uses the same
+    fraction of a full fit, so max_fits is the number of full fits
+    (RandomizedSearchCV(n_iter=1000, cv=5) uses 5000). The search stops
+    before a round that would exceed max_fits, or after max_seconds.
+    """
+
+    def __init__(self, max_seconds=None, max_fits=None):
+        self.max_seconds = max_seconds
+        self.max_fits = max_fits
+        self.start = time.perf_counter()
+        self.fits = 0
+        self.full_fits = 0.0
+
+    @property
+    def seconds(self):
+        """Gets the time since the start of the search."""
+        return time.perf_counter() - self.start
+
+    def can_spend(self, full_fits):
+        """Checks if the budget allows the next full_fits."""
+        if self.max_seconds is not None and self.seconds >= self.max_seconds:
+            return False
+        return (self.max_fits is None
+                or self.full_fits + full_fits <= self.max_fits + 1e-9)
+
+    def spend(self, fits, full_fits):
+        """Records the fits of a round."""
+        self.fits += fits
+        self.full_fits += full_fits
+
+
+@lru_cache(maxsize=None)
+def get_folds(num_rows, cv=5, random_state=None):
+    """Gets the train and test rows of every fold (cached).
+
+    The folds are the ones of KFold (like cv=5 of RandomizedSearchCV
+    for the regressors), shuffled if random_state is given. The train
+    rows are in a random order, so a fraction of them (see
+    fit_candidate) is a random sample.
+    """
+    rng = np.random.default_rng(random_state)
+    kfold = KFold(
+        n_splits=cv,
+        shuffle=random_state is not None,
+        random_state=random_state
+    )
+    return tuple(
+        (rng.permutation(train), test)
+        for train, test in kfold.split(np.empty((num_rows, 1)))
+    )
+
+
+def init_worker(x, y, folds):
+    """Keeps the data in the process, so it is sent once per process."""
+    worker_data.clear()
+    worker_data.update(x=x, y=y, folds=folds, splits={})
+
+
+def get_split(fold):
+    """Gets the train and test arrays of the fold (cached)."""
+    splits = worker_data["splits"]
+    if fold not in splits:
+        train, test = worker_data["folds"][fold]
+        x, y = worker_data["x"], worker_data["y"]
+        splits[fold] = (x[train], y[train], x[test], y[test])
+    return splits[fold]
+
+
+def get_resource(estimator):
+    """Gets the resource increased by the rounds of successive halving.
+
+    The ensembles get more estimators (warm-started if they support
+    warm_start), the other models more training rows.
+    """
+    params = estimator.get_params()
+    if "n_estimators" in params:
+        return "n_estimators"
+    return "n_samples"
+
+
+def fit_candidate(estimator, params, fold, fraction, model=None):
+    """Fits the candidate on the fraction of the resource in a fold.
+
+    If model (the candidate fitted on a smaller fraction) is given, the
+    warm-started ensemble only adds the new estimators. Returns the
+    score (R2 for the regressors) on the test rows, the fit time and
+    the model to warm-start the next round (None if not supported).
+    """
+    x_train, y_train, x_test, y_test = get_split(fold)
+    start = time.perf_counter()
+    all_params = {**estimator.get_params(), **params}
+    if get_resource(estimator) == "n_estimators":
+        n_estimators = max(1, round(all_params["n_estimators"] * fraction))
+        if model is None:
+            model = clone(estimator).set_params(**params)
+            if "warm_start" in all_params:
+                model.set_params(warm_start=True)
+        model.set_params(n_estimators=n_estimators)
+        model.fit(x_train, y_train)
+    else:
+        rows = max(2, math.ceil(len(x_train) * fraction))
+        model = clone(estimator).set_params(**params)
+        model.fit(x_train[:rows], y_train[:rows])
+    seconds = time.perf_counter() - start
+    score = model.score(x_test, y_test)
+    if "warm_start" not in all_params:
+        model = None
+    return score, seconds, model
+
+
+def run_round(estimator, candidates, fraction, models, cv, executor=None):
+    """Fits the candidates on every fold.
+
+    models is a dict of the warm-started models by (candidate, fold).
+    Returns the mean and the std of the scores of the candidates, the
+    fit time and the new models.
+    """
+    keys = [(i, fold) for i in range(len(candidates)) for fold in range(cv)]
+    args = [
+        (estimator, candidates[i], fold, fraction, models.get((i, fold)))
+        for i, fold in keys
+    ]
+    if executor is None:
+        results = [fit_candidate(*arg) for arg in args]
+    else:
+        futures = [executor.submit(fit_candidate, *arg) for arg in args]
+        results = [future.result() for future in futures]
+    scores = np.array([score for score, _, _ in results]).reshape(-1, cv)
+    seconds = sum(seconds for _, seconds, _ in results)
+    models = {
+        key: model for key, (_, _, model) in zip(keys, results)
+        if model is not None
+    }
+    return scores.mean(axis=1), scores.std(axis=1), seconds, models
+
+
+def successive_halving(estimator, candidates, first_fraction, factor, cv,
+                       budget, results, history, bracket=0,
+                       executor=None):
+    """Runs successive halving of the candidates.
+
+    Every round fits the candidates on a fraction of the resource (see
+    get_resource), and the best 1 / factor of them go to the next round
+    with factor times more resource, until the full resource. The
+    rows of results (every candidate in every round) and history
+    (every round) are appended. Returns False if the budget stopped
+    the search.
+    """
+    ids = list(range(len(candidates)))
+    models = {}
+    last_rung = round(math.log(1 / first_fraction, factor))
+    for rung in range(last_rung + 1):
+        # The last round has exactly the full resource.
+        fraction = float(factor) ** (rung - last_rung)
+        full_fits = len(ids) * cv * fraction
+        if not budget.can_spend(full_fits):
+            return False
+        mean, std, fit_seconds, models = run_round(
+            estimator, [candidates[i] for i in ids], fraction, models, cv,
+            executor
+        )
+        budget.spend(len(ids) * cv, full_fits)
+        for i, candidate in enumerate(ids):
+            results.append({
+                "bracket": bracket,
+                "rung": rung,
+                "candidate": candidate,
+                "fraction": fraction,
+                "mean_score": mean[i],
+                "std_score": std[i],
+                "params": candidates[candidate]
+            })
+        best, best_score, best_fraction = get_best(results)
+        history.append({
+            "bracket": bracket,
+            "rung": rung,
+            "fraction": fraction,
+            "candidates": len(ids),
+            "fits": budget.fits,
+            "full_fits": budget.full_fits,
+            "seconds": budget.seconds,
+            "fit_seconds": fit_seconds,
+            "best_score": best_score,
+            "best_fraction": best_fraction,
+            "best_params": best
+        })
+        if rung == last_rung:
+            break
+        # Keep the best candidates and their warm-started models.
+        keep = np.argsort(-mean, kind="stable")[
+            :max(1, len(ids) // factor)
+        ]
+        models = {
+            (new, fold): models[(old, fold)]
+            for new, old in enumerate(keep)
+            for fold in range(cv) if (old, fold) in models
+        }
+        ids = [ids[i] for i in keep]
+    return True
+
+
+def get_best(results):
+    """Gets the best params, score and fraction of the resource.
+
+    The scores on smaller fractions are lower, so the best candidate is
+    the best one on the largest fraction reached (the full resource
+    unless the budget ended before it).
+    """
+    if not results:
+        return None, np.nan, np.nan
+    fraction = max(row["fraction"] for row in results)
+    best = max(
+        (row for row in results if row["fraction"] == fraction),
+        key=lambda row: row["mean_score"]
+    )
+    return best["params"], best["mean_score"], fraction
+
+
+def search(estimator, param_distributions, x, y, method="hyperband",
+           n_candidates=81, factor=3, min_fraction=1 / 27, cv=5,
+           max_seconds=None, max_fits=None, n_jobs=None, random_state=None):
+    """Searches the hyperparameters within the budget.
+
+    The candidates are sampled from param_distributions like in
+    RandomizedSearchCV (see ParameterSampler). The method is:
+        - "halving": successive halving of n_candidates from
+          min_fraction of the resource (see successive_halving),
+        - "hyperband": the brackets of successive halving from
+          min_fraction (many candidates) to the full resource (few
+          candidates), repeated with new candidates until the budget
+          ends (max_fits or max_seconds is required).
+    The folds are cached (see get_folds) and the data is sent once to
+    every process of the pool if n_jobs is greater than 1. Returns a
+    dict with best_params, best_score and best_fraction (see get_best),
+    results (every candidate in every round) and history
+    (the best score versus the used budget after every round, see
+    get_budget_report).
+    """
+    if method == "hyperband" and max_seconds is None and max_fits is None:
+        raise ValueError("Hyperband needs max_seconds or max_fits.")
+    x = np.asarray(x)
+    y = np.asarray(y).ravel()
+    folds = get_folds(len(x), cv, random_state)
+    budget = Budget(max_seconds, max_fits)
+    results = []
+    history = []
+    max_rung = round(math.log(1 / min_fraction, factor))
+    executor = None
+    if n_jobs is not None and n_jobs > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(x, y, folds)
+        )
+    else:
+        init_worker(x, y, folds)
+    try:
+        if method == "halving":
+            candidates = list(ParameterSampler(
+                param_distributions, n_candidates, random_state=random_state
+            ))
+            successive_halving(
+                estimator, candidates, factor ** -max_rung, factor, cv,
+                budget, results, history, executor=executor
+            )
+        else:
+            bracket = 0
+            running = True
+            while running:
+                for s in range(max_rung, -1, -1):
+                    n = math.ceil((max_rung + 1) / (s + 1) * factor ** s)
+                    seed = None if random_state is None else (
+                        random_state + bracket
+                    )
+                    candidates = list(ParameterSampler(
+                        param_distributions, n, random_state=seed
+                    ))
+                    running = successive_halving(
+                        estimator, candidates, factor ** -s, factor, cv,
+                        budget, results, history, bracket, executor
+                    )
+                    bracket += 1
+                    if not running:
+                        break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        worker_data.clear()
+    best_params, best_score, best_fraction = get_best(results)
+    logger.info(
+        f"The search has used {budget.full_fits:.1f} full fits "
+        f"({budget.fits} fits) in {budget.seconds:.1f} s; the best score "
+        f"is {best_score:.4f} (fraction {best_fraction:.3f}) with "
+        f"{best_params}."
+    )
+    return {
+        "best_params": best_params,
+        "best_score": best_score,
+        "best_fraction": best_fraction,
+        "results": pd.DataFrame(results),
+        "history": pd.DataFrame(history)
+    }
+
+
+def get_budget_report(result, reference_fits=None, reference_seconds=None):
+    """Gets the best score versus the used budget of a search.
+
+    The reference is the budget of the replaced search, e.g. 5000 fits
+    of RandomizedSearchCV(n_iter=1000, cv=5) and its time, to show the
+    used fraction of it.
+    """
+    report = result["history"][[
+        "bracket", "rung", "fraction", "candidates", "fits", "full_fits",
+        "seconds", "best_score", "best_fraction", "best_params"
+    ]].copy()
+    if reference_fits is not None:
+        report["fits_pct"] = 100 * report["full_fits"] / reference_fits
+    if reference_seconds is not None:
+        report["seconds_pct"] = 100 * report["seconds"] / reference_seconds
+    return report
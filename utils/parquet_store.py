@@ -0,0 +1,171 @@
+# Import the bultin libraries.
+import logging
+import statistics
+import sys
+import time
+
+# Import the third-party libraries.
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Import the local/project packages, modules, and fucntions.
+from utils.fact_tables import load_player_games
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The text columns with few unique values.
+CATEGORY_COLUMNS = [
+    "first_name", "last_name", "name", "abbreviation", "full_name",
+    "position", "team", "pos"
+]
+
+# The column subsets used by the notebooks.
+COLUMN_SETS = {
+    "career": ["player_id", "season", "pts", "reb", "ast", "date",
+               "from_year", "to_year"],
+    "eff": ["player_id", "season", "pts", "reb", "ast", "blk", "fga", "fgm",
+            "fta", "ftm", "turnover"],
+    "all": None
+}
+
+
+def optimize_dtypes(df, categories=CATEGORY_COLUMNS):
+    """Converts the columns to compact dtypes.
+
+    The text columns from categories become categoricals, and the
+    integer columns are downcast. The float columns are kept as they
+    are, so the models get the same values.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if (column in categories
+                and (df[column].dtype == object
+                     or pd.api.types.is_string_dtype(df[column]))):
+            df[column] = df[column].astype("category")
+        elif pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+
+def save_parquet(df, path, partition_col="season", optimize=True):
+    """Saves the DataFrame as Parquet files partitioned by a column.
+
+    Every value of partition_col gets its own directory
+    (path/season=2000/...), so a load of some seasons reads only their
+    files. The existing files of the saved partitions are replaced.
+    The dtypes are converted by optimize_dtypes if optimize is True;
+    set it to False if the partitions are saved separately, because
+    the downcast types of the partitions could differ.
+    """
+    if optimize:
+        df = optimize_dtypes(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        path,
+        partition_cols=[partition_col],
+        existing_data_behavior="delete_matching"
+    )
+    logger.info(f"{len(df)} rows have been saved to {path}.")
+
+
+def load_parquet(path, columns=None, seasons=None, partition_col="season"):
+    """Loads the Parquet files saved by save_parquet.
+
+    Only the columns (all if None) and the partitions of the seasons
+    (all if None) are read.
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    flt = None
+    if seasons is not None:
+        flt = ds.field(partition_col).isin(list(seasons))
+    table = dataset.to_table(columns=columns, filter=flt)
+    df = table.to_pandas()
+    if partition_col in df.columns:
+        df[partition_col] = pd.to_numeric(
+            df[partition_col], downcast="integer"
+        )
+    return df
+
+
+def export_player_games(con, path="parquet/player_games",
+                        first_season=1983, last_season=2023):
+    """Exports the player-game rows from PostgreSQL to Parquet.
+
+    The rows are read from the fact tables (see
+    fact_tables.load_player_games) and saved by season.
+    """
+    df = load_player_games(con, first_season, last_season)
+    save_parquet(df, path)
+    return df
+
+
+def benchmark_formats(csv_path, parquet_path, column_sets=COLUMN_SETS,
+                      seasons=None, repeat=3, csv_kwargs=None):
+    """Compares loads of the same data from CSV and Parquet.
+
+    Every column subset is loaded with pd.read_csv (usecols) and
+    load_parquet. The seasons are filtered after the CSV load, as
+    pd.read_csv cannot skip rows by value. Returns a DataFrame with the
+    median load time and the DataFrame memory.
+    """
+    csv_kwargs = csv_kwargs or {}
+    results = []
+    for name, columns in column_sets.items():
+        loaders = {
+            "csv": lambda: read_csv_subset(
+                csv_path, columns, seasons, csv_kwargs
+            ),
+            "parquet": lambda: load_parquet(parquet_path, columns, seasons)
+        }
+        for file_format, loader in loaders.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                df = loader()
+                times.append(time.perf_counter() - start)
+            results.append({
+                "columns": name,
+                "format": file_format,
+                "rows": len(df),
+                "median_s": statistics.median(times),
+                "memory_mb": df.memory_usage(deep=True).sum() / 1024 ** 2
+            })
+    df = pd.DataFrame(results)
+    logger.info(f"The CSV/Parquet load benchmark:\n{df}")
+    return df
+
+
+def read_csv_subset(path, columns=None, seasons=None, csv_kwargs=None):
+    """Loads the columns and seasons from the CSV file."""
+    csv_kwargs = dict(csv_kwargs or {})
+    if columns is not None:
+        usecols = list(columns)
+        if seasons is not None and "season" not in usecols:
+            usecols.append("season")
+        csv_kwargs["usecols"] = usecols
+        # Parse only the loaded date columns.
+        if "parse_dates" in csv_kwargs:
+            csv_kwargs["parse_dates"] = [
+                column for column in csv_kwargs["parse_dates"]
+                if column in usecols
+            ]
+    df = pd.read_csv(path, **csv_kwargs)
+    if seasons is not None:
+        df = df[df["season"].isin(list(seasons))]
+        if columns is not None and "season" not in columns:
+            df = df.drop(columns="season")
+    return df
@@ -0,0 +1,260 @@
+# Import the bultin libraries.
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+# Import the third-party libraries.
+import pandas as pd
+from ydata_profiling import ProfileReport
+
+# Import the local/project packages, modules, and fucntions.
+from utils.db_io import connect, is_sqlite, peak_rss_mb, read_table
+from utils.sampling import sample_table
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def in_notebook():
+    """Checks if the code runs in a Jupyter kernel."""
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return False
+    shell = get_ipython()
+    return (shell is not None
+            and shell.__class__.__name__ == "ZMQInteractiveShell")
+
+
+def report_path(output_dir, table_name, num_rows=None):
+    """Gets the HTML path of the table report."""
+    if num_rows is None:
+        return os.path.join(output_dir, f"profile_report_{table_name}.html")
+    return os.path.join(
+        output_dir, f"profile_report_{table_name}_{num_rows}_samples.html"
+    )
+
+
+def table_fingerprint(conn, table_name, num_rows=None, seed=42):
+    """Gets a cheap fingerprint of the table contents.
+
+    The fingerprint has the row count, the max of the primary key (if
+    it is one column, or its id column) and of the date column (if
+    any), and the hash of the column names and types. For PostgreSQL,
+    the inserted, updated and deleted row counters of
+    pg_stat_user_tables are added, so the changes that keep the count
+    and the max values are also seen (the counters are updated with a
+    delay of some seconds, and a reset of them makes the reports stale,
+    not fresh). The num_rows and seed of the
+    sampled reports are added, so a report of another sample is not
+    reused.
+    """
+    cur = conn.cursor()
+    if is_sqlite(conn):
+        cur.execute(f'PRAGMA table_info("{table_name}")')
+        rows = cur.fetchall()
+        schema = [(row[1], row[2]) for row in rows]
+        key = [row[1] for row in sorted(rows, key=lambda row: row[5])
+               if row[5]]
+    else:
+        cur.execute("""
+            SELECT column_name, data_type
+              FROM information_schema.columns
+             WHERE table_schema = 'public'
+               AND table_name = %(table_name)s
+             ORDER BY ordinal_position
+        """, {"table_name": table_name})
+        schema = [tuple(row) for row in cur.fetchall()]
+        cur.execute("""
+            SELECT k.column_name
+              FROM information_schema.table_constraints AS c
+              JOIN information_schema.key_column_usage AS k
+                ON c.constraint_schema = k.constraint_schema
+               AND c.constraint_name = k.constraint_name
+             WHERE c.table_schema = 'public'
+               AND c.table_name = %(table_name)s
+               AND c.constraint_type = 'PRIMARY KEY'
+             ORDER BY k.ordinal_position
+        """, {"table_name": table_name})
+        key = [row[0] for row in cur.fetchall()]
+    id_column = key[0] if len(key) == 1 else ("id" if "id" in key else None)
+    date_column = next(
+        (column for column, _ in schema if "date" in column), None
+    )
+    aggregates = ["COUNT(*)"] + [
+        f'MAX("{column}")' for column in (id_column, date_column) if column
+    ]
+    cur.execute(f'SELECT {", ".join(aggregates)} FROM "{table_name}"')
+    row = cur.fetchone()
+    fingerprint = {
+        "rows": row[0],
+        "max_id": str(row[1]) if id_column else None,
+        "max_date": str(row[-1]) if date_column else None,
+        "schema": hashlib.sha256(json.dumps(schema).encode()).hexdigest(),
+    }
+    if not is_sqlite(conn):
+        # The counters of a partitioned table are in its partitions
+        # (pg_partition_tree is empty for a regular table).
+        cur.execute("""
+            WITH t AS (
+                SELECT to_regclass(
+                       'public.' || quote_ident(%(table_name)s)) AS oid
+            )
+            SELECT SUM(n_tup_ins), SUM(n_tup_upd), SUM(n_tup_del)
+              FROM pg_catalog.pg_stat_user_tables, t
+             WHERE relid = t.oid
+                OR relid IN (SELECT relid FROM pg_partition_tree(t.oid))
+        """, {"table_name": table_name})
+        fingerprint["changes"] = [
+            None if value is None else int(value) for value in cur.fetchone()
+        ]
+    if num_rows is not None:
+        fingerprint.update({"num_rows": num_rows, "seed": seed})
+    return fingerprint
+
+
+def fingerprint_path(path):
+    """Gets the fingerprint path saved next to the report."""
+    return f"{os.path.splitext(path)[0]}.json"
+
+
+def is_report_fresh(path, fingerprint):
+    """Checks if the report exists and was made from the same table."""
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(fingerprint_path(path)) as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
+
+
+def save_fingerprint(path, fingerprint):
+    """Saves the fingerprint of the table next to its report."""
+    with open(fingerprint_path(path), "w") as f:
+        json.dump(fingerprint, f, indent=4)
+
+
+def profile_table(database, table_name, output_dir, num_rows=None,
+                  chunksize=None, seed=42, force=False):
+    """Creates the report of the table in a worker process.
+
+    The worker opens its own connection. If num_rows is set, the table
+    is sampled (see sampling.sample_table), otherwise it is read whole
+    (in chunks if chunksize is set). The table is skipped if its
+    report was made from the same data (see table_fingerprint), unless
+    force is True. Returns a dict with the rows, wall time and peak RSS
+    of the worker.
+    """
+    start = time.perf_counter()
+    conn = connect(database)
+    path = report_path(output_dir, table_name, num_rows)
+    try:
+        fingerprint = table_fingerprint(conn, table_name, num_rows, seed)
+        if not force and is_report_fresh(path, fingerprint):
+            return {
+                "table": table_name,
+                "rows": min(fingerprint["rows"], num_rows or sys.maxsize),
+                "seconds": time.perf_counter() - start,
+                "peak_rss_mb": peak_rss_mb(),
+                "path": path,
+                "cached": True
+            }
+        if num_rows is not None:
+            df = sample_table(conn, table_name, num_rows, seed)
+        elif chunksize:
+            df = read_table(conn, table_name, chunksize)
+        else:
+            df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+    finally:
+        conn.close()
+    if df.empty:
+        path = None
+    else:
+        ProfileReport(df, minimal=True).to_file(path)
+        save_fingerprint(path, fingerprint)
+    return {
+        "table": table_name,
+        "rows": len(df),
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb(),
+        "path": path,
+        "cached": False
+    }
+
+
+def try_profile_table(args):
+    """Runs profile_table in a pool worker and catches its error.
+
+    Returns the table name, the result and the error message (None if
+    the report is ready).
+    """
+    try:
+        return args[1], profile_table(*args), None
+    except Exception as e:
+        return args[1], None, str(e)
+
+
+def create_reports_parallel(database, table_names, output_dir,
+                            excluded_tables=(), num_rows=100000,
+                            chunksize=None, seed=42, max_workers=None,
+                            force=False):
+    """Creates the reports of the tables in a process pool.
+
+    Every table is profiled by a new worker process (see
+    profile_table), so the peak RSS is measured per table. The widgets
+    are not rendered, and every report is saved as soon as it is
+    ready. The excluded_tables are sampled by num_rows rows. The
+    unchanged tables are skipped unless force is True. Returns a
+    DataFrame with the per-table summary.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    tasks = [
+        (database, table_name, output_dir,
+         num_rows if table_name in excluded_tables else None, chunksize,
+         seed, force)
+        for table_name in table_names
+    ]
+    # maxtasksperchild=1 starts a new process for every table (the
+    # max_tasks_per_child of ProcessPoolExecutor needs Python 3.11).
+    with multiprocessing.get_context("spawn").Pool(
+        processes=max_workers, maxtasksperchild=1
+    ) as pool:
+        for table_name, result, error in pool.imap_unordered(
+            try_profile_table, tasks
+        ):
+            if error is not None:
+                logger.error(f"The report for {table_name} failed: {error}.")
+                result = {
+                    "table": table_name, "cached": False, "error": error
+                }
+            else:
+                peak = result["peak_rss_mb"]
+                logger.info(
+                    f"The report for {table_name} is "
+                    f"{'cached' if result['cached'] else 'ready'} "
+                    f"({result['rows']} rows, {result['seconds']:.1f} s, "
+                    f"{'n/a' if peak is None else f'{peak:.0f}'} MB)."
+                )
+            results.append(result)
+    summary = pd.DataFrame(results).set_index("table")
+    cached = summary.index[summary["cached"].astype(bool)].tolist()
+    logger.info(
+        f"The profile reports summary:\n{summary}\n"
+        f"The unchanged (skipped) tables: {cached}"
+    )
+    return summary
@@ -0,0 +1,209 @@
+# Import the bultin libraries.
+import json
+import logging
+import sys
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+
+# Import the local/project packages, modules, and fucntions.
+from utils.db_io import is_sqlite, read_table_chunks
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def sample_table(conn, table_name, num_rows=100000, seed=42, method=None):
+    """Gets a random sample of num_rows rows of the table.
+
+    The sample is reproducible with the seed. The methods are:
+        - "system" (PostgreSQL default): TABLESAMPLE SYSTEM, reads
+          random pages,
+        - "bernoulli": TABLESAMPLE BERNOULLI, random rows,
+        - "rowid" (SQLite default): random rowids,
+        - "reservoir": a streaming reservoir over the whole table.
+    The first three read about num_rows rows instead of sorting the
+    whole table like ORDER BY RANDOM(). If they cannot be used (e.g. a
+    SQLite table without rowid), the reservoir is used.
+    """
+    if method is None:
+        method = "rowid" if is_sqlite(conn) else "system"
+    if method == "rowid":
+        df = sample_sqlite_rowids(conn, table_name, num_rows, seed)
+    elif method in ("system", "bernoulli"):
+        df = sample_postgres(conn, table_name, num_rows, seed, method)
+    elif method == "reservoir":
+        df = None
+    else:
+        raise ValueError(f"Unknown sampling method: {method}.")
+    if df is None:
+        logger.info(f"Using the reservoir sampling for {table_name}.")
+        df = reservoir_sample(
+            read_table_chunks(conn, table_name, downcast=False),
+            num_rows,
+            seed
+        )
+    logger.info(f"{len(df)} rows have been sampled from {table_name}.")
+    return df
+
+
+def sample_postgres(conn, table_name, num_rows, seed=42, method="system"):
+    """Samples the PostgreSQL table with TABLESAMPLE.
+
+    The percent is estimated from pg_class.reltuples with a margin and
+    doubled until the sample has num_rows rows. All sampled rows are
+    fetched and num_rows of them are drawn with the seed, since a LIMIT
+    would keep the rows of the first sampled pages.
+    """
+    from psycopg import sql
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT reltuples::BIGINT
+          FROM pg_catalog.pg_class
+         WHERE oid = to_regclass(%(table_name)s)
+    """, {"table_name": table_name})
+    row = cur.fetchone()
+    total = row[0] if row else -1
+    # The table has never been analyzed.
+    if total <= 0:
+        cur.execute(
+            sql.SQL("SELECT COUNT(*) FROM {}").format(
+                sql.Identifier(table_name)
+            )
+        )
+        total = cur.fetchone()[0]
+    if total <= num_rows:
+        return read_all(cur, table_name)
+    percent = min(100.0, num_rows / total * 100 * 1.2)
+    query = sql.SQL("""
+        SELECT *
+          FROM {} TABLESAMPLE {} (%(percent)s) REPEATABLE (%(seed)s)
+    """).format(sql.Identifier(table_name), sql.SQL(method.upper()))
+    while True:
+        cur.execute(query, {"percent": percent, "seed": seed})
+        rows = cur.fetchall()
+        if len(rows) >= num_rows or percent >= 100:
+            break
+        percent = min(100.0, percent * 2)
+    columns = [column[0] for column in cur.description]
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    if len(df) > num_rows:
+        df = df.sample(n=num_rows, random_state=seed)
+    return df.reset_index(drop=True)
+
+
+def sample_sqlite_rowids(conn, table_name, num_rows, seed=42,
+                         max_rounds=10):
+    """Samples the SQLite table by random rowids.
+
+    The rowids are drawn from the [MIN(rowid), MAX(rowid)] range, which
+    SQLite reads from the ends of the table b-tree. The rowids that
+    hit gaps are drawn again. Returns None if the table has no rowid,
+    or if max_rounds have not found num_rows rows (too sparse rowids),
+    so sample_table uses the reservoir.
+    """
+    rng = np.random.default_rng(seed)
+    cur = conn.cursor()
+    try:
+        cur.execute(f'SELECT MIN(rowid), MAX(rowid) FROM "{table_name}"')
+    except conn.OperationalError:
+        return None
+    min_rowid, max_rowid = cur.fetchone()
+    if min_rowid is None:
+        return pd.DataFrame()
+    if max_rowid - min_rowid + 1 <= num_rows:
+        return read_all(cur, table_name)
+    query = f"""
+        SELECT *
+          FROM "{table_name}"
+         WHERE rowid IN (SELECT value FROM json_each(?))
+    """
+    drawn = np.empty(0, dtype=np.int64)
+    chunks = []
+    found = 0
+    hit_rate = 1.0
+    for _ in range(max_rounds):
+        need = num_rows - found
+        size = int(need / hit_rate * 1.1) + 1
+        candidates = np.unique(
+            rng.integers(min_rowid, max_rowid + 1, size, dtype=np.int64)
+        )
+        candidates = np.setdiff1d(candidates, drawn, assume_unique=True)
+        if not len(candidates):
+            break
+        drawn = np.union1d(drawn, candidates)
+        cur.execute(query, (json.dumps(candidates.tolist()),))
+        rows = cur.fetchall()
+        chunks.append(rows)
+        found += len(rows)
+        hit_rate = max(len(rows) / len(candidates), 0.01)
+        if found >= num_rows:
+            break
+    if found < num_rows and len(drawn) < max_rowid - min_rowid + 1:
+        logger.warning(
+            f"{found} of {num_rows} rows have been found by the random "
+            f"rowids of {table_name} in {max_rounds} rounds."
+        )
+        return None
+    columns = [column[0] for column in cur.description]
+    df = pd.DataFrame.from_records(
+        [row for rows in chunks for row in rows], columns=columns
+    )
+    if len(df) > num_rows:
+        df = df.sample(n=num_rows, random_state=seed)
+    return df.reset_index(drop=True)
+
+
+def reservoir_sample(chunks, num_rows, seed=42):
+    """Samples num_rows rows from a stream of DataFrames.
+
+    This is the reservoir algorithm R applied to whole chunks: every
+    row of the stream gets into the sample with the same probability,
+    and only the reservoir and one chunk are kept in memory.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        if reservoir is None:
+            reservoir = chunk.iloc[:0]
+        # Fill the reservoir first.
+        fill = min(num_rows - len(reservoir), len(chunk))
+        if fill > 0:
+            reservoir = pd.concat(
+                [reservoir, chunk.iloc[:fill]], ignore_index=True
+            )
+        rest = np.arange(fill, len(chunk))
+        # The i-th row of the stream replaces a random row j < i.
+        positions = rng.integers(0, seen + rest + 1)
+        replaced = positions < num_rows
+        if replaced.any():
+            slots = positions[replaced]
+            rows = rest[replaced]
+            # Keep the last replacement of every slot.
+            _, last = np.unique(slots[::-1], return_index=True)
+            last = len(slots) - 1 - last
+            reservoir.iloc[slots[last]] = chunk.iloc[rows[last]].to_numpy()
+        seen += len(chunk)
+    return pd.DataFrame() if reservoir is None else reservoir
+
+
+def read_all(cur, table_name):
+    """Loads the whole (small) table."""
+    cur.execute(f'SELECT * FROM "{table_name}"')
+    columns = [column[0] for column in cur.description]
+    return pd.DataFrame.from_records(
+        cur.fetchall(), columns=columns, coerce_float=True
+    )
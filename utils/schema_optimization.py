@@ -0,0 +1,151 @@
+# Import the bultin libraries.
+import logging
+import statistics
+import sys
+
+# Import the third-party libraries.
+import pandas as pd
+
+# Import the local/project packages, modules, and fucntions.
+from utils.data_collection import create_indexes, create_tables
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The main analytical join of sql_scripts/data_collection_queries.sql
+# (the player-game rows with the career bounds).
+ANALYTICAL_QUERY = """
+      WITH player_career AS (
+    SELECT s.player_id,
+           EXTRACT (YEAR FROM MIN(date)) AS from_year,
+           EXTRACT (YEAR FROM MAX(date)) AS to_year
+      FROM stats AS s
+      JOIN games AS g
+        ON s.game_id = g.id
+     GROUP BY s.player_id)
+    SELECT s.player_id,
+           p.first_name,
+           p.last_name,
+           t.abbreviation,
+           g.season,
+           s.pts,
+           s.reb,
+           s.ast,
+           {minutes},
+           g.date,
+           pc.from_year,
+           pc.to_year
+      FROM stats AS s
+      JOIN games AS g
+        ON s.game_id = g.id
+      JOIN players AS p
+        ON s.player_id = p.id
+      JOIN teams AS t
+        ON s.team_id = t.id
+      JOIN player_career AS pc
+        ON s.player_id = pc.player_id
+     WHERE {season} BETWEEN 1983 AND 2023
+"""
+
+
+def migrate_to_optimized(cur, conn, schema="optimized"):
+    """Copies the tables to the optimized schema.
+
+    The tables are created in the schema with
+    data_collection.create_tables(cur, optimized=True), filled from the
+    public tables (the minutes are parsed to seconds in SQL) and then
+    indexed with data_collection.create_indexes.
+    """
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+    try:
+        create_tables(cur, optimized=True)
+        for table in ("teams", "games", "players", "checkpoints"):
+            cur.execute(f"""
+                INSERT INTO {table}
+                SELECT * FROM public.{table}
+                ON CONFLICT DO NOTHING
+            """)
+            logger.info(f"The {table} table has been copied to {schema}.")
+        # The minutes look like "34:12" or "34"; other values are NULL.
+        cur.execute(r"""
+            INSERT INTO stats (
+                   id, season, game_id, team_id, player_id, ast, blk, dreb,
+                   fg3_pct, fg3a, fg3m, fg_pct, fga, fgm, ft_pct, fta, ftm,
+                   min_seconds, oreb, pf, pts, reb, stl, turnover
+            )
+            SELECT s.id, g.season, s.game_id, s.team_id, s.player_id,
+                   s.ast, s.blk, s.dreb, s.fg3_pct, s.fg3a, s.fg3m,
+                   s.fg_pct, s.fga, s.fgm, s.ft_pct, s.fta, s.ftm,
+                   CASE
+                       WHEN s.min ~ '^\d+(\.\d+)?(:\d+)?$'
+                       THEN ROUND(SPLIT_PART(s.min, ':', 1)::NUMERIC * 60)
+                            + COALESCE(
+                                  NULLIF(SPLIT_PART(s.min, ':', 2), '')::INT,
+                                  0
+                              )
+                   END,
+                   s.oreb, s.pf, s.pts, s.reb, s.stl, s.turnover
+              FROM public.stats AS s
+              JOIN public.games AS g
+                ON s.game_id = g.id
+            ON CONFLICT DO NOTHING
+        """)
+        logger.info(f"The stats table has been copied to {schema}.")
+        create_indexes(cur)
+        conn.commit()
+    finally:
+        cur.execute("SET search_path TO public")
+
+
+def time_query(cur, query, repeat=3):
+    """Gets the median execution time of the query in ms.
+
+    The time is taken from EXPLAIN ANALYZE, so the rows are not sent to
+    the client.
+    """
+    times = []
+    for _ in range(repeat):
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
+        plan = cur.fetchone()[0]
+        times.append(plan[0]["Execution Time"])
+    return statistics.median(times)
+
+
+def benchmark_analytical_join(cur, schema="optimized", repeat=3):
+    """Compares the analytical join on the public and optimized tables.
+
+    Run migrate_to_optimized first. Returns a DataFrame with the
+    median execution time for both schemas.
+    """
+    queries = {
+        "public": ANALYTICAL_QUERY.format(minutes="s.min", season="g.season"),
+        # Filter by the partition key, so the partitions are pruned.
+        schema: ANALYTICAL_QUERY.format(
+            minutes="s.min_seconds", season="s.season"
+        )
+    }
+    results = []
+    try:
+        for search_path, query in queries.items():
+            cur.execute(f"SET search_path TO {search_path}")
+            results.append({
+                "schema": search_path,
+                "median_ms": time_query(cur, query, repeat)
+            })
+    finally:
+        cur.execute("SET search_path TO public")
+    df = pd.DataFrame(results)
+    df["speedup"] = df["median_ms"].iloc[0] / df["median_ms"]
+    logger.info(f"The analytical join benchmark:\n{df}")
+    return df
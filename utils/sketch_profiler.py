@@ -0,0 +1,465 @@
+# Import the bultin libraries.
+import html
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Import the third-party libraries.
+import numpy as np
+import pandas as pd
+
+# Import the local/project packages, modules, and fucntions.
+from utils.db_io import connect, is_sqlite, read_table_chunks
+
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    "{asctime} | {name} | {levelname} | {message}", style="{"
+)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# The quantiles shown in the reports.
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def bit_length(values):
+    """Gets the number of bits of every uint64 value."""
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= np.uint64(1) << np.uint64(shift)
+        lengths[big] += shift
+        values[big] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+def canonical_values(values):
+    """Converts the numbers to float64 before hashing or counting.
+
+    An integer column is int64 in the chunks without NULLs and float64
+    in the others, and pd.util.hash_pandas_object hashes 1 and 1.0
+    differently, so the numbers are hashed as float64.
+    """
+    if (pd.api.types.is_numeric_dtype(values)
+            and not pd.api.types.is_bool_dtype(values)):
+        return values.astype(np.float64)
+    return values
+
+
+class HyperLogLog:
+    """Estimates the number of distinct values.
+
+    There are 2 ** p registers (4 KB for p=12, ~1.6% error). The values
+    are hashed by pd.util.hash_pandas_object (the numbers as float64,
+    see canonical_values), which gives the same hashes in every
+    process, so the sketches of the workers can be merged.
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    def update(self, values):
+        """Adds the values (a Series without nulls)."""
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(
+            canonical_values(values), index=False
+        ).to_numpy()
+        index = hashes >> np.uint64(64 - self.p)
+        rest = hashes << np.uint64(self.p)
+        ranks = np.minimum(64 - bit_length(rest) + 1, 64 - self.p + 1)
+        np.maximum.at(self.registers, index, ranks.astype(np.uint8))
+
+    def merge(self, other):
+        """Adds the registers of another sketch."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """Gets the estimated number of distinct values."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m ** 2 / np.sum(2.0 ** -self.registers.astype(int))
+        zeros = np.count_nonzero(self.registers == 0)
+        # Use the linear counting for the small cardinalities.
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class QuantileSketch:
+    """Estimates the quantiles of numeric values.
+
+    This is a KLL-style sketch: every level keeps at most k values, and
+    a full level is sorted and every second value is promoted to the
+    next level with a double weight. The memory is O(k log n), and two
+    sketches are merged level by level.
+    """
+
+    def __init__(self, k=1024, seed=0):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+
+    def update(self, values):
+        """Adds the values (a numpy array without NaN)."""
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def merge(self, other):
+        """Adds the values of another sketch."""
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.compress()
+
+    def compress(self):
+        """Promotes the values of the full levels."""
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self.k:
+                values = np.sort(values)
+                # Keep the last value of an odd number of values.
+                keep = values[len(values) - len(values) % 2:]
+                pairs = values[:len(values) - len(values) % 2]
+                promoted = pairs[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+            level += 1
+
+    def quantiles(self, qs=QUANTILES):
+        """Gets the estimated quantiles."""
+        values = np.concatenate(self.levels)
+        if not len(values):
+            return {q: None for q in qs}
+        weights = np.concatenate([
+            np.full(len(level_values), 2.0 ** level)
+            for level, level_values in enumerate(self.levels)
+        ])
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(
+            cumulative, np.asarray(qs) * cumulative[-1]
+        )
+        positions = np.minimum(positions, len(values) - 1)
+        return {q: float(values[order][i]) for q, i in zip(qs, positions)}
+
+
+class TopK:
+    """Finds the most frequent values (the Misra-Gries summary).
+
+    At most capacity counters are kept. When there are more, the
+    counter of the (capacity + 1)-th value is subtracted from all of
+    them, so the counts are lower bounds and every value more frequent
+    than n / capacity is kept.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, values):
+        """Adds the values (a Series without nulls)."""
+        self.add(canonical_values(values).value_counts())
+
+    def merge(self, other):
+        """Adds the counters of another summary."""
+        self.add(other.counts)
+
+    def add(self, counts):
+        """Adds the counts and drops the rare values."""
+        self.counts = self.counts.add(counts, fill_value=0).astype("int64")
+        if len(self.counts) > self.capacity:
+            counts = self.counts.sort_values(ascending=False)
+            threshold = counts.iloc[self.capacity]
+            self.counts = (counts - threshold)[counts > threshold]
+
+    def top(self, k=10):
+        """Gets the k most frequent values and their counts.
+
+        The values with the same count are sorted by their text, so the
+        result does not depend on the order of the merges.
+        """
+        order = np.lexsort((
+            self.counts.index.astype(str), -self.counts.to_numpy()
+        ))
+        counts = self.counts.iloc[order[:k]]
+        # The integers are counted as float64 (see canonical_values).
+        return [
+            (str(int(value)) if isinstance(value, float)
+             and value.is_integer() else str(value), int(count))
+            for value, count in counts.items()
+        ]
+
+
+class ColumnSketch:
+    """Keeps the mergeable statistics of one column.
+
+    The statistics are the counts of values and nulls, the distinct
+    count (HyperLogLog), the top values (TopK) and, for the numeric
+    columns, min, max, mean, variance and quantiles (QuantileSketch).
+    """
+
+    def __init__(self, seed=0):
+        self.count = 0
+        self.nulls = 0
+        self.numeric = None
+        # The number of the values added to the moments.
+        self.moments = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.distinct = HyperLogLog()
+        self.quantiles = QuantileSketch(seed=seed)
+        self.top = TopK()
+
+    def update(self, series):
+        """Adds a chunk of the column."""
+        self.count += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if self.numeric is None and len(values):
+            self.numeric = (pd.api.types.is_numeric_dtype(values)
+                            and not pd.api.types.is_bool_dtype(values))
+        self.distinct.update(values)
+        self.top.update(values)
+        if self.numeric and len(values):
+            array = values.to_numpy(dtype=np.float64)
+            self.add_moments(
+                len(array), array.mean(), ((array - array.mean()) ** 2).sum(),
+                array.min(), array.max()
+            )
+            self.quantiles.update(array)
+
+    def add_moments(self, n, mean, m2, minimum, maximum):
+        """Adds the moments of other values (Chan's parallel formula)."""
+        total = self.moments + n
+        delta = mean - self.mean
+        self.m2 += m2 + delta ** 2 * self.moments * n / total
+        self.mean += delta * n / total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+        self.moments = total
+
+    def merge(self, other):
+        """Adds the statistics of another sketch of the column."""
+        if other.numeric and other.moments:
+            self.add_moments(
+                other.moments, other.mean, other.m2, other.min,
+                other.max
+            )
+        self.numeric = self.numeric if other.numeric is None else other.numeric
+        self.count += other.count
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        self.quantiles.merge(other.quantiles)
+        self.top.merge(other.top)
+
+    def to_dict(self):
+        """Gets the statistics as a JSON-serializable dict."""
+        result = {
+            "type": "numeric" if self.numeric else "text",
+            "count": self.count,
+            "nulls": self.nulls,
+            "null_pct": 100 * self.nulls / self.count if self.count else 0,
+            "distinct": self.distinct.estimate(),
+            "top": self.top.top()
+        }
+        n = self.moments
+        if self.numeric and n:
+            result.update({
+                "min": float(self.min),
+                "max": float(self.max),
+                "mean": self.mean,
+                "std": (self.m2 / (n - 1)) ** 0.5 if n > 1 else 0.0,
+                "quantiles": {
+                    str(q): value
+                    for q, value in self.quantiles.quantiles().items()
+                }
+            })
+        return result
+
+
+class TableProfile:
+    """Keeps the column sketches of a table."""
+
+    def __init__(self, table_name, seed=0):
+        self.table_name = table_name
+        self.seed = seed
+        self.rows = 0
+        self.columns = {}
+
+    def update(self, df):
+        """Adds a chunk of the table."""
+        self.rows += len(df)
+        for column in df.columns:
+            if column not in self.columns:
+                self.columns[column] = ColumnSketch(self.seed)
+            self.columns[column].update(df[column])
+
+    def merge(self, other):
+        """Adds the sketches of another part of the table."""
+        self.rows += other.rows
+        for column, sketch in other.columns.items():
+            if column in self.columns:
+                self.columns[column].merge(sketch)
+            else:
+                self.columns[column] = sketch
+
+    def to_dict(self):
+        """Gets the profile as a JSON-serializable dict."""
+        return {
+            "table": self.table_name,
+            "rows": self.rows,
+            "columns": {
+                column: sketch.to_dict()
+                for column, sketch in self.columns.items()
+            }
+        }
+
+    def to_html(self):
+        """Renders the profile as a compact HTML page."""
+        profile = self.to_dict()
+        rows = []
+        for column, stats in profile["columns"].items():
+            quantiles = stats.get("quantiles", {})
+            rows.append({
+                "column": column,
+                "type": stats["type"],
+                "nulls %": round(stats["null_pct"], 2),
+                "distinct": stats["distinct"],
+                "min": stats.get("min"),
+                "mean": stats.get("mean"),
+                "std": stats.get("std"),
+                **{f"q{q}": value for q, value in quantiles.items()},
+                "max": stats.get("max"),
+                "top values": ", ".join(
+                    f"{value} ({count})" for value, count in stats["top"][:5]
+                )
+            })
+        table = pd.DataFrame(rows).to_html(
+            index=False, na_rep="", float_format="{:.4g}".format
+        )
+        title = html.escape(f"Profile of {self.table_name}")
+        return (
+            f"<html><head><meta charset='utf-8'><title>{title}</title>"
+            f"</head><body><h1>{title}</h1>"
+            f"<p>{profile['rows']} rows, {len(self.columns)} columns.</p>"
+            f"{table}</body></html>"
+        )
+
+    def save(self, path):
+        """Saves the profile as HTML and JSON (path without suffix)."""
+        with open(f"{path}.html", "w") as f:
+            f.write(self.to_html())
+        with open(f"{path}.json", "w") as f:
+            json.dump(self.to_dict(), f, indent=4, default=str)
+        logger.info(f"The profile of {self.table_name} has been saved.")
+
+
+def profile_table(conn, table_name, chunksize=100000, seed=0):
+    """Profiles the whole table in one pass.
+
+    The table is streamed in chunks (see db_io.read_table_chunks), so
+    memory does not depend on the table size. Returns TableProfile.
+    """
+    start = time.perf_counter()
+    profile = TableProfile(table_name, seed)
+    for df in read_table_chunks(conn, table_name, chunksize, downcast=False):
+        profile.update(df)
+    logger.info(
+        f"The {table_name} table has been profiled: {profile.rows} rows, "
+        f"{time.perf_counter() - start:.1f} s."
+    )
+    return profile
+
+
+def profile_key_range(database, table_name, key, start, stop,
+                      chunksize=100000, seed=0):
+    """Profiles the rows with start <= key < stop in a worker process."""
+    conn = connect(database)
+    if is_sqlite(conn):
+        cur = conn.cursor()
+        query = f'SELECT * FROM "{table_name}" WHERE {key} >= ? AND {key} < ?'
+    else:
+        cur = conn.cursor(name=f"profile_{table_name}_{start}")
+        query = (
+            f'SELECT * FROM "{table_name}" '
+            f'WHERE "{key}" >= %s AND "{key}" < %s'
+        )
+    profile = TableProfile(table_name, seed)
+    try:
+        cur.execute(query, (start, stop))
+        columns = [column[0] for column in cur.description]
+        while rows := cur.fetchmany(chunksize):
+            profile.update(pd.DataFrame.from_records(
+                rows, columns=columns, coerce_float=True
+            ))
+    finally:
+        conn.close()
+    return profile
+
+
+def profile_table_parallel(database, table_name, key="rowid", max_workers=4,
+                           chunksize=100000, seed=0):
+    """Profiles the table by parts in a process pool.
+
+    The range of the integer key column (rowid for SQLite, e.g. id for
+    PostgreSQL) is split into max_workers parts, every worker profiles
+    its part (see profile_key_range) and the sketches are merged in the
+    order of the parts. The counts, nulls, min, max, mean and std are
+    the same as of profile_table; the sketches (distinct counts,
+    quantiles and top values) are approximate and depend on the parts,
+    but they are the same for the same seed and max_workers.
+    database is a SQLite path or a PostgreSQL conninfo string.
+    """
+    start = time.perf_counter()
+    conn = connect(database)
+    try:
+        cur = conn.cursor()
+        column = key if is_sqlite(conn) else f'"{key}"'
+        cur.execute(
+            f'SELECT MIN({column}), MAX({column}) FROM "{table_name}"'
+        )
+        first, last = cur.fetchone()
+    finally:
+        conn.close()
+    profile = TableProfile(table_name, seed)
+    if first is None:
+        return profile
+    bounds = np.linspace(first, last + 1, max_workers + 1).astype(np.int64)
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(
+                profile_key_range, database, table_name, key,
+                int(bounds[i]), int(bounds[i + 1]), chunksize, seed + i
+            )
+            for i in range(max_workers)
+        ]
+        for future in futures:
+            profile.merge(future.result())
+    logger.info(
+        f"The {table_name} table has been profiled by {max_workers} "
+        f"workers: {profile.rows} rows, "
+        f"{time.perf_counter() - start:.1f} s."
+    )
+    return profile